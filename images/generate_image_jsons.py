@@ -1,5 +1,14 @@
 import os
+import sys
+import shutil
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow がなければサムネイルと縦横サイズは作らない
+    Image = None
 
 # 画像拡張子のリスト
 IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif'}
@@ -10,35 +19,192 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # viewerディレクトリ（images/ と同じ階層にある想定）
 VIEWER_DIR = os.path.join(BASE_DIR, '..', 'viewer')
 
+# 前回の走査結果（フォルダごとの更新時刻と画像ごとのメタデータ）
+STATE_FILE = os.path.join(BASE_DIR, '.manifest_state.json')
+
+MANIFEST_NAME = 'images.json'
+SCAN_WORKERS = 16
+
+# サムネイルは各フォルダの thumbs/ に「元のファイル名.webp」で置く（PNG の 1/10 程度の大きさ）
+# GitHub Pages (Jekyll) は "." で始まるパスを公開しないので、ドットなしの名前にする
+THUMB_DIR = 'thumbs'
+OLD_THUMB_DIR = '.thumbs'  # 以前の置き場所。見つけたら消す
+THUMB_SIZE = (320, 320)
+THUMB_QUALITY = 80
+
 def is_image_file(filename):
     return os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS
 
 def generate_json_for_folder(folder_path):
-    files = [f for f in os.listdir(folder_path) if is_image_file(f)]
-    files.sort()
+    # ファイル名 → (サイズ, 更新時刻)
+    with os.scandir(folder_path) as entries:
+        files = {}
+        for entry in entries:
+            if entry.is_file() and is_image_file(entry.name):
+                stat = entry.stat()
+                files[entry.name] = (stat.st_size, stat.st_mtime_ns)
     return files
 
+def thumb_name(filename):
+    return f"{THUMB_DIR}/{filename}.webp"
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def process_image(folder_path, filename, old):
+    """1枚分のメタデータを作る。内容のハッシュが前回と同じならサムネイルは作り直さない"""
+    path = os.path.join(folder_path, filename)
+    stat = os.stat(path)
+    meta = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": file_hash(path)}
+    if Image is None:
+        meta.update(width=None, height=None, thumb=None)
+        return meta
+
+    thumb_path = os.path.join(folder_path, thumb_name(filename))
+    if old.get("hash") == meta["hash"] and old.get("thumb") == thumb_name(filename) and os.path.exists(thumb_path):
+        meta.update(width=old["width"], height=old["height"], thumb=old["thumb"])
+        return meta
+
+    with Image.open(path) as img:
+        meta.update(width=img.width, height=img.height)
+        thumb = img.convert('RGBA')  # GIF は1フレーム目
+    thumb.thumbnail(THUMB_SIZE)
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    tmp_path = f"{thumb_path}.tmp"
+    thumb.save(tmp_path, format='WEBP', quality=THUMB_QUALITY)
+    os.replace(tmp_path, thumb_path)
+    meta["thumb"] = thumb_name(filename)
+    return meta
+
+def manifest_entry(filename, meta):
+    return {
+        "name": filename,
+        "width": meta["width"],
+        "height": meta["height"],
+        "bytes": meta["size"],
+        "hash": meta["hash"],
+        "thumb": meta["thumb"],
+    }
+
+def to_json(data):
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+def write_if_changed(path, content):
+    # 内容が同じならファイルに触らない（更新時刻も変えない）
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return True
+
+def load_state():
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_state(state):
+    write_if_changed(STATE_FILE, json.dumps(state, ensure_ascii=False, sort_keys=True))
+
+def list_folders(image_root):
+    # フォルダ名 → ディレクトリの更新時刻（ファイルの追加・削除・名前変更で変わる）
+    with os.scandir(image_root) as entries:
+        return {
+            entry.name: entry.stat().st_mtime_ns
+            for entry in entries if entry.is_dir() and not entry.name.startswith('.')
+        }
+
+def has_old_thumbs(folder_state):
+    # 以前の置き場所（.thumbs/）を指すサムネイルが残っているか
+    return any(
+        meta.get("thumb") and not meta["thumb"].startswith(f"{THUMB_DIR}/")
+        for meta in folder_state.get("images", {}).values()
+    )
+
+def remove_stale_thumbs(folder_path, files):
+    shutil.rmtree(os.path.join(folder_path, OLD_THUMB_DIR), ignore_errors=True)
+    thumb_dir = os.path.join(folder_path, THUMB_DIR)
+    if not os.path.isdir(thumb_dir):
+        return
+    keep = {os.path.basename(thumb_name(name)) for name in files}
+    with os.scandir(thumb_dir) as entries:
+        for entry in entries:
+            if entry.name not in keep:
+                os.remove(entry.path)
+
+def update_folders(image_root, targets, state):
+    """targets のフォルダを走査し、変わった画像だけをプロセスプールで処理して images.json を書く"""
+    paths = {name: os.path.join(image_root, name) for name in targets}
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        scanned = dict(zip(targets, executor.map(generate_json_for_folder, paths.values())))
+
+    # サイズと更新時刻が前回と同じ画像（サムネイルも残っているもの）はそのまま使う
+    images, jobs = {}, []
+    for name, files in scanned.items():
+        cached = state.get(name, {}).get("images", {})
+        images[name] = {}
+        for filename, (size, mtime_ns) in files.items():
+            old = cached.get(filename, {})
+            thumb = old.get("thumb")
+            if (old.get("size"), old.get("mtime_ns")) == (size, mtime_ns) \
+                    and (Image is None or (thumb == thumb_name(filename) and os.path.exists(os.path.join(paths[name], thumb)))):
+                images[name][filename] = old
+            else:
+                jobs.append((name, filename, old))
+
+    if jobs:
+        with ProcessPoolExecutor() as executor:
+            results = executor.map(process_image, *zip(*[(paths[name], filename, old) for name, filename, old in jobs]))
+            for (name, filename, _), meta in zip(jobs, results):
+                images[name][filename] = meta
+        print(f"{len(jobs)} 枚の画像を処理しました")
+
+    for name in targets:
+        remove_stale_thumbs(paths[name], images[name])
+        entries = [manifest_entry(filename, images[name][filename]) for filename in sorted(images[name])]
+        if write_if_changed(os.path.join(paths[name], MANIFEST_NAME), to_json(entries)):
+            print(f"  -> {name}/{MANIFEST_NAME} を更新しました ({len(entries)} 件)")
+        # images.json やサムネイルを書くとフォルダの更新時刻も変わるので、書いた後の値を記録する
+        state[name] = {"mtime_ns": os.stat(paths[name]).st_mtime_ns, "images": images[name]}
+
 def main():
     image_root = BASE_DIR
-    folder_names = []
-
-    for folder_name in os.listdir(image_root):
-        folder_path = os.path.join(image_root, folder_name)
-        if os.path.isdir(folder_path):
-            print(f"処理中: {folder_path}")
-            image_list = generate_json_for_folder(folder_path)
-            json_path = os.path.join(folder_path, 'images.json')
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(image_list, f, ensure_ascii=False, indent=2)
-            print(f"  -> {json_path} を作成しました ({len(image_list)} 件)")
-            folder_names.append(folder_name)
+    # --rescan: 更新時刻に関係なく全フォルダを走査する（同名ファイルの上書きはフォルダの更新時刻を変えないため）
+    rescan = '--rescan' in sys.argv[1:]
+    state = load_state()
+    folders = list_folders(image_root)
+
+    # 前回から更新時刻が変わったフォルダ（と images.json がないフォルダ）だけを走査する
+    targets = [
+        name for name, mtime_ns in folders.items()
+        if rescan or state.get(name, {}).get("mtime_ns") != mtime_ns
+        or "images" not in state.get(name, {})
+        or has_old_thumbs(state.get(name, {}))
+        or not os.path.exists(os.path.join(image_root, name, MANIFEST_NAME))
+    ]
+    update_folders(image_root, targets, state)
+
+    for name in set(state) - set(folders):
+        del state[name]
+    save_state(state)
+    print(f"{len(targets)} / {len(folders)} フォルダを走査しました")
 
     # フォルダ一覧を viewer/list.json に書き出し
     list_json_path = os.path.join(VIEWER_DIR, 'list.json')
-    folder_names.sort()
-    with open(list_json_path, 'w', encoding='utf-8') as f:
-        json.dump(folder_names, f, ensure_ascii=False, indent=2)
-    print(f"\nviewer/list.json を更新しました ({len(folder_names)} フォルダ)\n")
+    folder_names = sorted(folders)
+    if write_if_changed(list_json_path, to_json(folder_names)):
+        print(f"\nviewer/list.json を更新しました ({len(folder_names)} フォルダ)\n")
 
 if __name__ == "__main__":
     main()
@@ -1,161 +1,129 @@
 import requests
 from bs4 import BeautifulSoup
 import re
-import pickle
 from pathlib import Path
-import os
+import sys
 
-CACHE_FILE = "yutai_cache.pkl"
+# kabuka/ の共通モジュールを読み込めるようにする
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
+import getyfinance
+import make_yutai_data
+from cache_store import Cache
+from fetch_pool import TokenBucket, run_concurrently
+from http_client import fetch_cached
+from minkabu_parser import YUTAI_FIELDS, parse_yutai_detail
 
-def load_yutai_cache():
-    if Path(CACHE_FILE).exists():
-        try:
-            with open(CACHE_FILE, "rb") as f:
-                return pickle.load(f)
-        except:
-            return {}
-    return {}
+CACHE_FILE = Path(__file__).resolve().parent / "yutai_cache.pkl"
+DETAIL_URL = "https://minkabu.jp/stock/{code}/yutai"
+CACHE_MAX_ENTRIES = 5000
+FETCH_WORKERS = 8
+FETCH_RATE = 4  # 1秒あたりのリクエスト数
 
-def save_yutai_cache(cache):
-    with open(CACHE_FILE, "wb") as f:
-        pickle.dump(cache, f)
 
-def extract_yutai_info(code):
-    url = f"https://minkabu.jp/stock/{code}/yutai"
-    headers = {"User-Agent": "Mozilla/5.0"}
-    response = requests.get(url, headers=headers)
+def open_yutai_cache():
+    return Cache(CACHE_FILE, "yutai_detail", max_entries=CACHE_MAX_ENTRIES)
+
+def extract_yutai_info(code, limiter=None):
+    try:
+        response = fetch_cached(DETAIL_URL.format(code=code), limiter=limiter)
+    except requests.RequestException as e:
+        print(f"[{code}] ページ取得失敗: {e}")
+        return None
 
     if response.status_code != 200:
         print(f"[{code}] ページ取得失敗: {response.status_code}")
         return None
 
-    soup = BeautifulSoup(response.text, "html.parser")
-
-    result = {
-        "優待内容": "-",
-        "優待利回り": "-",
-        "配当利回り": "-",
-        "最低投資金額": "-",
-        "優待発生株数": "-",
-        "優待権利確定月": "-",
-        "権利確定日": "-"
-    }
-
     try:
-        # 優待内容
-        summary_tag = soup.find("h3", id="yutai_summary")
-        if summary_tag:
-            result["優待内容"] = summary_tag.text.strip()
-
-        # 優待利回り
-        yutai_rate = soup.find("td", id="yutai_valuations_yutai")
-        if yutai_rate:
-            result["優待利回り"] = yutai_rate.text.strip()
-
-        # 配当利回り
-        haito_rate = soup.find("td", id="yutai_valuations_haito")
-        if haito_rate:
-            result["配当利回り"] = haito_rate.text.strip()
-
-        # 最低投資金額
-        kin = soup.find("th", string="最低投資金額")
-        if kin and kin.find_next_sibling("td"):
-            result["最低投資金額"] = kin.find_next_sibling("td").text.strip()
-
-        # 優待発生株数
-        unit = soup.find("th", string="優待発生株数")
-        if unit and unit.find_next_sibling("td"):
-            result["優待発生株数"] = unit.find_next_sibling("td").text.strip()
-
-        # 優待権利確定月
-        month = soup.find("th", string="優待権利確定月")
-        if month and month.find_next_sibling("td"):
-            result["優待権利確定月"] = month.find_next_sibling("td").text.strip()
-
-        # 権利確定日
-        date = soup.find_all("th", string="権利確定日")
-        if date:
-            result["権利確定日"] = date[-1].find_next_sibling("td").text.strip()
-
+        # 304（前回と同じページ）なら保存済みの解析結果を使う
+        return response.parse(parse_yutai_detail)
     except Exception as e:
         print(f"[{code}] パースエラー: {e}")
+        return None
 
-    return result
+
+def listing_fields(listing):
+    """検索結果の1銘柄分を個別ページと同じ項目名に直す（載っていない項目は含めない）"""
+    fields = {}
+    if not listing:
+        return fields
+    if listing.get("summary"):
+        fields["優待内容"] = listing["summary"]
+    if listing.get("rate"):
+        fields["優待利回り"] = f"{listing['rate']:.2f}%"
+    if listing.get("dividend") is not None:
+        fields["配当利回り"] = f"{listing['dividend']:.2f}%"
+    if listing.get("investment"):
+        fields["最低投資金額"] = listing["investment"]
+    if listing.get("months"):
+        fields["優待権利確定月"] = ",".join(listing["months"])
+    return fields
+
+
+def fetch_missing_yutai_info(codes, cache):
+    """未取得・期限切れの銘柄だけを共有セッションで並列に取得し、cache に追加する"""
+    def fetch_many(missing):
+        print(f"優待情報を取得中... ({len(missing)} 件)")
+        limiter = TokenBucket(FETCH_RATE, FETCH_WORKERS)
+        results = run_concurrently(lambda code: extract_yutai_info(code, limiter), missing, FETCH_WORKERS)
+        return {code: info for code, info in zip(missing, results) if info}
+
+    return cache.refresh(codes, fetch_many)
+
+
+def merge_yutai_info(code, cache, universe=None):
+    """個別ページの情報のうち取れなかった項目（"-"）だけを検索結果の値で補う
+
+    個別ページにある値は書式も含めてそのまま使う。どちらにもない銘柄は None。
+    """
+    # 取り直しに失敗した場合は期限切れの情報でも使う
+    detail = cache.get(code, allow_stale=True)
+    fields = listing_fields((universe or {}).get(code))
+    if not detail and not fields:
+        return None
+    info = dict.fromkeys(YUTAI_FIELDS, "-")
+    info.update(detail or {})
+    for key, value in fields.items():
+        if info[key] == "-":
+            info[key] = value
+    return info
 
 
-def insert_info_into_html(input_path, output_path):
+def insert_info_into_html(input_path, output_path, cache=None, universe=None):
+    # cache を渡された場合は呼び出し側が読み込み・保存を管理する
     with open(input_path, encoding="utf-8") as f:
         soup = BeautifulSoup(f, "html.parser")
 
     companies = soup.find_all("div", class_="company-name")
-    cache = load_yutai_cache()
-    updated = False
-
+    shared_cache = cache is not None
+    if not shared_cache:
+        cache = open_yutai_cache()
+    if universe is None:
+        # パイプラインと同じく、保存済みの検索結果（取り直さない）の値を重ねる
+        universe = make_yutai_data.load_cached_universe()
+
+    targets = []
     for company_div in companies:
         match = re.search(r"\((\d{4})\)", company_div.text)
-        if not match:
-            continue
-        code = match.group(1)
-        print(f"[{code}] 優待情報取得中...")
-
-        if code in cache:
-            info = cache[code]
-        else:
-            info = extract_yutai_info(code)
-            if not info:
-                continue
-            cache[code] = info
-            updated = True
-
-        # 表形式で出力（3行構成）
-        table = soup.new_tag("table", **{"class": "yutai-info-table", "border": "1", "style": "margin-bottom: 1em; border-collapse: collapse;"})
-
-        # 優待内容行
-        tr1 = soup.new_tag("tr")
-        th1 = soup.new_tag("th")
-        th1.string = "優待内容"
-        td1 = soup.new_tag("td", colspan="3")
-        td1.string = f"{info['優待内容']}（{info['優待利回り']}）"
-        tr1.append(th1)
-        tr1.append(td1)
-        table.append(tr1)
-
-        # 配当利回りと最低投資金額
-        tr2 = soup.new_tag("tr")
-        th2a = soup.new_tag("th")
-        th2a.string = "配当利回り"
-        td2a = soup.new_tag("td")
-        td2a.string = info["配当利回り"]
-        th2b = soup.new_tag("th")
-        th2b.string = "最低投資金額"
-        td2b = soup.new_tag("td")
-        td2b.string = info["最低投資金額"]
-        for tag in [th2a, td2a, th2b, td2b]:
-            tr2.append(tag)
-        table.append(tr2)
-
-        # 優待発生株数・権利確定月・日
-        tr3 = soup.new_tag("tr")
-        th3a = soup.new_tag("th")
-        th3a.string = "優待発生株数"
-        td3a = soup.new_tag("td")
-        td3a.string = info["優待発生株数"]
-        th3b = soup.new_tag("th")
-        th3b.string = "優待権利確定月・日"
-        td3b = soup.new_tag("td")
-        td3b.string = f"{info['優待権利確定月']}／{info['権利確定日']}"
-        for tag in [th3a, td3a, th3b, td3b]:
-            tr3.append(tag)
-        table.append(tr3)
+        if match:
+            targets.append((company_div, match.group(1)))
+
+    updated = fetch_missing_yutai_info([code for _, code in targets], cache) > 0
 
+    for company_div, code in targets:
+        info = merge_yutai_info(code, cache, universe)
+        if not info:
+            continue
+        # 表はパイプラインが直接書き出す最終版と同じもの（3行構成）
+        table = BeautifulSoup(getyfinance.render_yutai_table(info), "html.parser")
         company_div.insert_after(table)
 
     with open(output_path, "w", encoding="utf-8") as f:
         f.write(str(soup))
 
-    if updated:
-        save_yutai_cache(cache)
+    if updated and not shared_cache:
+        cache.save()
 
     print(f"処理が完了しました：{output_path}")
 
@@ -0,0 +1,208 @@
+import argparse
+import html
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import getyfinance
+import make_yutai_data
+import screener
+import seasonal
+from cache_store import Cache
+from incremental import write_if_changed
+from price_store import PriceStore
+
+# 権利月からの相対月。各月の前半（get_window の月初ウィンドウ）の平均で売買する
+ENTRY_OFFSETS = (-3, -2, -1, 0)
+EXIT_OFFSETS = (1, 2, 3)
+
+OUTPUT_DIR = "backtest"
+
+# 2024/add_yutai_info.py が保存する優待詳細（検索結果に配当利回りがない銘柄に使う）
+DETAIL_CACHE_FILE = Path(__file__).resolve().parent / "2024" / "yutai_cache.pkl"
+
+SUMMARY_STYLE = """
+  <style>
+    body { font-family: sans-serif; margin: 2em; }
+    table { border-collapse: collapse; margin: 1em 0 2em 0; }
+    th, td { border: 1px solid #ddd; padding: 6px 10px; text-align: right; }
+    th { background-color: #f2f2f2; }
+    .plus { color: #c00; }
+    .minus { color: #06c; }
+  </style>
+"""
+
+SUMMARY_FOOTER = """</body>
+</html>
+"""
+
+_matrix = None
+
+
+def _init_worker(matrix):
+    global _matrix
+    _matrix = matrix
+
+
+def income_per_month(universe, details):
+    """銘柄ごとの1回の権利取りで得る優待・配当（%）
+
+    優待利回り・配当利回りは年間の値なので、権利月が複数ある銘柄は月数で割る
+    （概算。過去の利回りは残っていないので現在の値を全年に使う）。
+    配当利回りは検索結果にあればそれを、なければ個別ページの値を使う。
+    """
+    income = {}
+    for code, info in universe.items():
+        months = max(len(info["months"]), 1)
+        dividend = info.get("dividend")
+        if dividend is None:
+            dividend = screener.parse_percent((details.get(code) or {}).get("配当利回り"))
+        income[code] = (info["rate"] / months, dividend / months)
+    return income
+
+
+def backtest_month(month, codes, year, lookback, income):
+    """month が権利月の銘柄について、全ての (買い, 売り) の組を年 × 銘柄でまとめて計算する"""
+    matrix = _matrix.reindex(columns=codes)
+    means = seasonal.WindowMeans(matrix)
+    years = list(range(year - lookback + 1, year + 1))
+    offsets = sorted(set(ENTRY_OFFSETS) | set(EXIT_OFFSETS))
+    prices = {
+        offset: np.array([means.mean(*getyfinance.get_window(*seasonal.shift_month(y, month, offset))) for y in years])
+        for offset in offsets
+    }
+    yutai = np.array([income[code][0] for code in codes])
+    dividend = np.array([income[code][1] for code in codes])
+
+    rows = []
+    for entry in ENTRY_OFFSETS:
+        for exit_ in EXIT_OFFSETS:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                change = (prices[exit_] / prices[entry] - 1) * 100  # (年, 銘柄)
+            traded = ~np.isnan(change)
+            trades = traded.sum(axis=0)
+            total = np.where(traded, change + yutai + dividend, 0.0)
+            wins = (total > 0).sum(axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean_change = np.where(traded, change, 0.0).sum(axis=0) / trades
+                mean_total = total.sum(axis=0) / trades
+            for i, code in enumerate(codes):
+                if not trades[i]:
+                    continue
+                rows.append((
+                    month, entry, exit_, code, int(trades[i]),
+                    float(mean_change[i]), float(yutai[i]), float(dividend[i]),
+                    float(mean_total[i]), float(wins[i] / trades[i]),
+                ))
+    return rows
+
+
+RESULT_COLUMNS = ["month", "entry", "exit", "code", "trades", "price_change", "yutai", "dividend", "total", "win_rate"]
+
+
+def run_backtest(universe, matrix, year, lookback=4, details=None, workers=None):
+    income = income_per_month(universe, details or {})
+    by_month = screener.universe_months(universe)
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(matrix,)) as executor:
+        futures = [
+            executor.submit(backtest_month, month, codes, year, lookback, income)
+            for month, codes in by_month.items() if codes
+        ]
+        for future in futures:
+            rows.extend(future.result())
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def summarize(results):
+    # (権利月, 買い, 売り) ごとに銘柄をまとめる
+    grouped = results.groupby(["month", "entry", "exit"])
+    return pd.DataFrame({
+        "codes": grouped["code"].count(),
+        "trades": grouped["trades"].sum(),
+        "price_change": grouped["price_change"].mean(),
+        "total": grouped["total"].mean(),
+        "median_total": grouped["total"].median(),
+        "win_rate": grouped["win_rate"].mean(),
+    }).reset_index()
+
+
+def month_label(offset):
+    return {0: "権利月"}.get(offset, f"{abs(offset)}ヶ月{'前' if offset < 0 else '後'}")
+
+
+def render_summary(summary, results, year, lookback, top=5):
+    title = f"{year}年までの{lookback}年間 権利月バックテスト"
+    signed = lambda value: f'<td class="{"plus" if value > 0 else "minus"}">{value:+.2f}%</td>'
+    parts = [
+        f'<!DOCTYPE html>\n<html lang="ja">\n<head>\n  <meta charset="UTF-8">\n  <title>{title}</title>{SUMMARY_STYLE}</head>\n<body>\n',
+        f"<h1>{title}</h1>\n",
+    ]
+    # 組ごとの上位銘柄
+    leaders = (
+        results.sort_values("total", ascending=False)
+        .groupby(["month", "entry", "exit"])["code"]
+        .apply(lambda codes: " ".join(codes.head(top)))
+    )
+    for month, rows in summary.groupby("month"):
+        rows = rows.sort_values("total", ascending=False)
+        parts.append(f"<h2>{month}月権利</h2>\n<table>\n")
+        parts.append("<tr><th>買い（月初）</th><th>売り（月初）</th><th>銘柄数</th><th>取引数</th>"
+                     "<th>値動き</th><th>優待・配当込み</th><th>中央値</th><th>勝率</th><th>上位銘柄</th></tr>\n")
+        for row in rows.itertuples():
+            parts.append(
+                f"<tr><td>{month_label(row.entry)}</td><td>{month_label(row.exit)}</td>"
+                f"<td>{row.codes}</td><td>{row.trades}</td>"
+                f"{signed(row.price_change)}{signed(row.total)}{signed(row.median_total)}"
+                f"<td>{row.win_rate * 100:.0f}%</td><td>{html.escape(leaders[(month, row.entry, row.exit)])}</td></tr>\n"
+            )
+        parts.append("</table>\n")
+    parts.append(SUMMARY_FOOTER)
+    return "".join(parts)
+
+
+def load_matrix(store, codes, year, lookback, fetch=True):
+    offsets = sorted(set(ENTRY_OFFSETS) | set(EXIT_OFFSETS))
+    ranges = [seasonal.history_range(year, month, lookback, offsets) for month in range(1, 13)]
+    start_date, end_date = min(r[0] for r in ranges), max(r[1] for r in ranges)
+    if fetch:
+        getyfinance.load_price_histories(store, codes, start_date, end_date)
+    return store.read_close_matrix(codes, start_date, end_date)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="権利月前後の売買（X月に買い Y月に売る）を全銘柄・全年で検証する")
+    parser.add_argument("--year", type=int, required=True, help="検証する最終年 (例: 2024)")
+    parser.add_argument("--lookback", type=int, default=4, help="遡る年数")
+    parser.add_argument("--workers", type=int, default=None, help="並列プロセス数")
+    parser.add_argument("--no-fetch", action="store_true", help="保存済みの日足・優待銘柄一覧だけを使う")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    args = parser.parse_args()
+
+    # --no-fetch のときは優待銘柄一覧も取り直さず、保存済みのものを使う
+    universe = make_yutai_data.load_cached_universe() if args.no_fetch else make_yutai_data.load_universe()
+    if not universe:
+        raise SystemExit(f"優待銘柄一覧がありません: {make_yutai_data.CACHE_FILE}")
+    details = Cache(DETAIL_CACHE_FILE, "yutai_detail").as_dict()
+    store = PriceStore(getyfinance.CONFIG['PRICE_DB_FILE'])
+    matrix = load_matrix(store, list(universe), args.year, args.lookback, not args.no_fetch)
+    store.close()
+
+    results = run_backtest(universe, matrix, args.year, args.lookback, details, args.workers)
+    summary = summarize(results)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    results_file = Path(args.output_dir) / f"{args.year}_results.csv"
+    summary_file = Path(args.output_dir) / f"{args.year}_summary.html"
+    write_if_changed(results_file, results.to_csv(index=False, float_format="%.4f"))
+    write_if_changed(summary_file, render_summary(summary, results, args.year, args.lookback))
+    logging.info(f"バックテスト完了: {len(results)} 行")
+    print(f"処理が完了しました。{summary_file} を確認してください。")
+
+
+if __name__ == "__main__":
+    main()
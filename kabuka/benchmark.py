@@ -0,0 +1,363 @@
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import shutil
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import getyfinance
+import http_client
+import incremental
+import instrument
+import make_yutai_data
+from cache_store import Cache
+from fetch_pool import TokenBucket, run_concurrently
+from getyfinance import write_html_output
+from minkabu_parser import make_soup, parse_search_item, parse_search_page, parse_yutai_detail
+from pipeline import add_yutai_info
+from price_store import PriceStore
+from stand_in import StandInHandler, make_detail_page, make_search_page, serve
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# 記録した（または合成した）株価 CSV と みんかぶ の HTML。無いものは初回に合成して保存する
+#   prices/{code}.csv            … FixtureSource と同じ Date,Close 形式
+#   minkabu/search/page_NNNN.html … 検索結果ページ
+#   minkabu/stock/{code}.html     … 銘柄ごとの優待ページ
+FIXTURE_DIR = BASE_DIR / "bench_fixtures"
+
+# コミットごとの計測結果（前回のコミットとの比較に使う）
+RESULTS_DIR = BASE_DIR / "bench_results"
+
+E2E_SIZES = [50, 500, 4000]
+ITEMS_PER_PAGE = 20
+E2E_STAGES = ["crawl", "prices", "yutai", "build", "rebuild", "refresh"]
+
+
+def make_companies(count, year, seed=0):
+    # 実データと同じ形の company_data を乱数で作る
+    rng = random.Random(seed)
+    companies = []
+    for i in range(count):
+        company = {"code": str(1000 + i), "name": f"銘柄{i}"}
+        for y in range(year-3, year+1):
+            rights_price = rng.uniform(100, 5000)
+            company[f"{y}_rights_price"] = rights_price
+            company[str(y)] = [
+                {"price": price, "percentage": price / rights_price * 100}
+                for price in (rights_price * rng.uniform(0.7, 1.3) for _ in range(5))
+            ]
+        companies.append(company)
+    return companies
+
+
+def bench_render(sizes, year=2024, month=4):
+    print("銘柄数\t時間(秒)\t銘柄あたり(ms)\tピークメモリ(KB)")
+    for size in sizes:
+        companies = make_companies(size, year)
+        order = [company["code"] for company in companies]
+        out = io.StringIO()
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        write_html_output(out, companies, year, month, {}, order)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"{size}\t{elapsed:.3f}\t{elapsed / size * 1000:.3f}\t{peak // 1024}")
+
+
+def bench_parse(pages):
+    search_pages = [make_search_page(page) for page in range(pages)]
+    detail_pages = [make_detail_page(1000 + page) for page in range(pages)]
+
+    # 各バックエンドで同じ値が取れることを確認してから計測する
+    backends = ["html.parser"]
+    try:
+        import lxml  # noqa: F401
+        backends.append("lxml")
+    except ImportError:
+        pass
+    expected = [parse_search_page(html, "html.parser") for html in search_pages]
+    expected_detail = [parse_yutai_detail(html, "html.parser") for html in detail_pages]
+    for backend in backends[1:]:
+        assert [parse_search_page(html, backend) for html in search_pages] == expected
+        assert [parse_yutai_detail(html, backend) for html in detail_pages] == expected_detail
+
+    # 従来の方法（ページ全体を html.parser で解析）
+    started = time.perf_counter()
+    for html in search_pages:
+        for item in make_soup(html, backend="html.parser").find_all("li", class_="yutai_rank_style"):
+            parse_search_item(item)
+    baseline_rate = pages / (time.perf_counter() - started)
+
+    print("バックエンド\t検索(ページ/秒)\t個別(ページ/秒)")
+    print(f"全体解析\t{baseline_rate:.1f}\t-")
+    for backend in backends:
+        started = time.perf_counter()
+        for html in search_pages:
+            parse_search_page(html, backend)
+        search_rate = pages / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for html in detail_pages:
+            parse_yutai_detail(html, backend)
+        detail_rate = pages / (time.perf_counter() - started)
+
+        print(f"{backend}\t{search_rate:.1f}\t{detail_rate:.1f}")
+
+
+def use_stand_in(base_url, fixture_dir):
+    # 取得先をローカルの代替サーバーと株価 CSV に向ける。レート制限は実サイト向けなので外して計測する
+    make_yutai_data.BASE_URL = f"{base_url}/yutai/search"
+    add_yutai_info.DETAIL_URL = f"{base_url}/stock/{{code}}/yutai"
+    make_yutai_data.CRAWL_RATE = add_yutai_info.FETCH_RATE = 10000
+    getyfinance.CONFIG['RATE_LIMIT'] = getyfinance.CONFIG['RATE_BURST'] = 10000
+    getyfinance.CONFIG['PRICE_FIXTURE_DIR'] = str(Path(fixture_dir) / "prices")
+
+
+def make_price_fixtures(fixture_dir, codes, start_date, end_date):
+    """記録のない銘柄の株価 CSV を乱数（銘柄ごとに固定）で作る"""
+    price_dir = Path(fixture_dir) / "prices"
+    price_dir.mkdir(parents=True, exist_ok=True)
+    dates = pd.bdate_range(start_date, end_date, name="Date")
+    created = 0
+    for code in codes:
+        path = price_dir / f"{code}.csv"
+        if path.exists():
+            continue
+        rng = np.random.default_rng(int(code))
+        closes = rng.uniform(100, 5000) * np.exp(np.cumsum(rng.normal(0, 0.015, len(dates))))
+        pd.Series(closes.round(1), index=dates, name="Close").to_csv(path)
+        created += 1
+    return created
+
+
+def record_fixtures(fixture_dir, codes, year, month, pages):
+    """実サイトから株価と HTML を取得して fixture_dir に保存する（ネットワークが必要）"""
+    from http_client import fetch
+    from price_source import YFinanceSource
+
+    fixture_dir = Path(fixture_dir)
+    for sub in ("prices", "minkabu/search", "minkabu/stock"):
+        (fixture_dir / sub).mkdir(parents=True, exist_ok=True)
+
+    closes = YFinanceSource().download_closes(codes, *getyfinance.get_history_range(year, month))
+    closes = {code: series for code, series in closes.items() if not series.empty}
+    for code, series in closes.items():
+        series.rename("Close").to_csv(fixture_dir / "prices" / f"{code}.csv", index_label="Date")
+
+    limiter = TokenBucket(add_yutai_info.FETCH_RATE, 1)
+    for page in range(make_yutai_data.FIRST_PAGE, make_yutai_data.FIRST_PAGE + pages):
+        html = make_yutai_data.fetch_search_page(page).text
+        (fixture_dir / "minkabu" / "search" / f"page_{page:04d}.html").write_text(html, encoding="utf-8")
+        limiter.acquire()
+    for code in codes:
+        res = fetch(add_yutai_info.DETAIL_URL.format(code=code), limiter=limiter)
+        if res.status_code == 200:
+            (fixture_dir / "minkabu" / "stock" / f"{code}.html").write_text(res.text, encoding="utf-8")
+    print(f"記録しました: 株価 {len(closes)} 銘柄 / 検索 {pages} ページ / 優待 {len(codes)} 銘柄")
+
+
+def crawl(pages):
+    # make_yutai_data.fetch_all_yutai_data と同じくページ単位で並列に取得・解析する
+    os.makedirs(make_yutai_data.CRAWL_DIR, exist_ok=True)
+    limiter = TokenBucket(make_yutai_data.CRAWL_RATE, make_yutai_data.CRAWL_WORKERS)
+    results = run_concurrently(
+        lambda page: make_yutai_data.crawl_page(page, limiter), pages, make_yutai_data.CRAWL_WORKERS,
+    )
+    universe = {}
+    for crawled in results:
+        universe.update(crawled[0] if crawled else {})
+    return universe
+
+
+def run_e2e(size, year, month, memory=False):
+    """size 銘柄の月を 取得 → 株価 → 優待 → レポート作成 まで通して実行し、段階ごとの時間を返す"""
+    stages = {}
+
+    def stage(name, func, *args):
+        if memory:
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            result = func(*args)
+        stages[name] = {"seconds": round(time.perf_counter() - started, 4)}
+        if memory:
+            stages[name]["peak_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+        return result
+
+    first_page = make_yutai_data.FIRST_PAGE
+    pages = list(range(first_page, first_page + math.ceil(size / ITEMS_PER_PAGE)))
+    universe = stage("crawl", crawl, pages)
+    codes = list(universe)[:size]
+
+    store = PriceStore("prices.db")
+    stage("prices", getyfinance.load_price_histories, store, codes, *getyfinance.get_history_range(year, month))
+
+    cache = Cache("yutai_cache.pkl", "yutai_detail")
+    stage("yutai", add_yutai_info.fetch_missing_yutai_info, codes, cache)
+    yutai_data = {code: add_yutai_info.merge_yutai_info(code, cache, universe) for code in codes}
+
+    output_file = f"{year}/{month:02d}_final.html"
+    stage("build", incremental.generate_report, codes, year, month, {}, store, output_file, yutai_data, True)
+    # 入力が変わらない2回目（月ごとスキップされる経路）
+    stage("rebuild", incremental.generate_report, codes, year, month, {}, store, output_file, yutai_data)
+    store.close()
+
+    # 優待一覧・優待情報を全件取り直す（条件付き GET で 304 になり、解析も省かれる経路）
+    def refresh():
+        shutil.rmtree(make_yutai_data.CRAWL_DIR, ignore_errors=True)
+        crawl(pages)
+        add_yutai_info.fetch_missing_yutai_info(codes, Cache("yutai_refresh.pkl", "yutai_detail"))
+    stage("refresh", refresh)
+    return len(codes), stages
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no", "."], cwd=BASE_DIR, capture_output=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def load_previous_result(results_dir, revision):
+    # 今回と別のコミットで最後に記録した結果
+    results = []
+    for path in Path(results_dir).glob("*.json"):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("revision") != revision:
+            results.append(data)
+    return max(results, key=lambda data: data["recorded_at"], default=None)
+
+
+def bench_e2e(sizes, year=2024, month=3, fixture_dir=FIXTURE_DIR, results_dir=RESULTS_DIR, memory=True):
+    fixture_dir = Path(fixture_dir).resolve()
+    first_page = make_yutai_data.FIRST_PAGE
+    # 合成ページの銘柄コードは 1000 + ページ × 20 + 行 になる
+    max_pages = math.ceil(max(sizes) / ITEMS_PER_PAGE)
+    synthetic_codes = [str(1000 + page * ITEMS_PER_PAGE + i) for page in range(first_page, first_page + max_pages) for i in range(ITEMS_PER_PAGE)]
+    created = make_price_fixtures(fixture_dir, synthetic_codes, *getyfinance.get_history_range(year, month))
+    if created:
+        print(f"株価の fixture を {created} 銘柄分作成しました: {fixture_dir / 'prices'}")
+
+    revision = git_revision()
+    record = {
+        "revision": revision,
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "year": year,
+        "month": month,
+        "sizes": {},
+    }
+    cwd = os.getcwd()
+    with serve(StandInHandler, fixture_dir=Path(fixture_dir)) as base_url:
+        use_stand_in(base_url, fixture_dir)
+        for size in sizes:
+            result = {}
+            # 1回目は時間、2回目は tracemalloc でピークメモリを測る（tracemalloc は処理を遅くするため分ける）
+            for measure_memory in ([False, True] if memory else [False]):
+                with tempfile.TemporaryDirectory() as work_dir:
+                    os.chdir(work_dir)
+                    instrument.reset()
+                    http_client._response_cache = http_client.ResponseCache(Path(work_dir) / "http_cache")
+                    make_yutai_data.CRAWL_DIR = Path(work_dir) / "yutai_crawl"
+                    if measure_memory:
+                        tracemalloc.start()
+                    try:
+                        count, stages = run_e2e(size, year, month, measure_memory)
+                    finally:
+                        if measure_memory:
+                            tracemalloc.stop()
+                        os.chdir(cwd)
+                if measure_memory:
+                    for name, values in stages.items():
+                        result["stages"][name]["peak_kb"] = values["peak_kb"]
+                else:
+                    summary = instrument.summary()
+                    result = {
+                        "codes": count,
+                        "total": round(sum(values["seconds"] for values in stages.values()), 4),
+                        "stages": stages,
+                        "timers": {name: values["total"] for name, values in summary["timers"].items()},
+                        "counters": summary["counters"],
+                    }
+            record["sizes"][str(size)] = result
+
+    previous = load_previous_result(results_dir, revision)
+    print_e2e(record, previous)
+    os.makedirs(results_dir, exist_ok=True)
+    path = Path(results_dir) / f"{revision}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {path}")
+    return record
+
+
+def print_e2e(record, previous=None):
+    def change(size, stage, seconds):
+        try:
+            before = previous["sizes"][size]["stages"][stage]["seconds"] if stage else previous["sizes"][size]["total"]
+        except (KeyError, TypeError):
+            return "-"
+        return f"{(seconds / before - 1) * 100:+.1f}%" if before else "-"
+
+    if previous:
+        print(f"比較対象: {previous['revision']} ({previous['recorded_at']})")
+    print("銘柄数\t段階\t時間(秒)\tピークメモリ(KB)\t前回比")
+    for size, result in record["sizes"].items():
+        for stage in E2E_STAGES:
+            values = result["stages"][stage]
+            print(f"{result['codes']}\t{stage}\t{values['seconds']:.3f}\t{values.get('peak_kb', '-')}\t{change(size, stage, values['seconds'])}")
+        print(f"{result['codes']}\t合計\t{result['total']:.3f}\t-\t{change(size, None, result['total'])}")
+        counters = result["counters"]
+        print(f"\tHTTP {counters.get('http.requests', 0)} 回 / {counters.get('http.bytes', 0) // 1024} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="レポート生成・ページ解析のベンチマーク")
+    parser.add_argument("target", nargs="?", choices=["render", "parse", "e2e", "all"], default="all")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000, 4000])
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--codes", type=int, nargs="+", default=E2E_SIZES, help="e2e で1ヶ月に含める銘柄数")
+    parser.add_argument("--fixtures", default=str(FIXTURE_DIR), help="記録済みの株価・HTML のディレクトリ")
+    parser.add_argument("--results", default=str(RESULTS_DIR), help="コミットごとの結果の保存先")
+    parser.add_argument("--no-memory", action="store_true", help="e2e でピークメモリを測らない")
+    parser.add_argument("--record", metavar="CODE_FILE", help="CODE_FILE の銘柄の株価・HTML を実サイトから記録する")
+    args = parser.parse_args()
+
+    if args.record:
+        codes = getyfinance.load_codes(args.record)
+        record_fixtures(args.fixtures, codes, 2024, 3, math.ceil(len(codes) / ITEMS_PER_PAGE))
+        return
+
+    if args.target in ("render", "all"):
+        bench_render(args.sizes)
+    if args.target in ("parse", "all"):
+        bench_parse(args.pages)
+    if args.target in ("e2e", "all"):
+        bench_e2e(args.codes, fixture_dir=args.fixtures, results_dir=args.results, memory=not args.no_memory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import logging
+import os
+import pickle
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import instrument
+
+DAY = 24 * 60 * 60
+
+# データの種類ごとの有効期間（秒）
+TTL = {
+    "yutai_universe": 7 * DAY,   # 検索結果から作る優待銘柄一覧（利回り・権利月・優待内容・投資金額）
+    "yutai_master": 7 * DAY,     # 1page目取得.py の優待概要
+    "yutai_detail": 30 * DAY,    # 銘柄ごとの優待詳細ページ
+    "price_report": None,        # 旧 yf_cache.pkl（期限なし）
+}
+
+FORMAT_VERSION = 1
+
+_KIND_TTL = object()
+
+
+class Cache:
+    """エントリごとに保存時刻を持つ pickle キャッシュ
+
+    - 有効期間 (TTL) はデータの種類ごとに決め、期限切れのキーは stale_keys() で取れる
+    - max_entries を超えたら最も長く使われていないエントリから捨てる (LRU)
+    - 保存は一時ファイルに書いてから置き換えるので、途中で落ちても壊れない
+    - 旧形式（dict や code を持つ dict のリスト）はファイルの更新時刻で読み込む
+    """
+
+    def __init__(self, path, kind, ttl=_KIND_TTL, max_entries=None):
+        self.path = Path(path)
+        self.kind = kind
+        self.ttl = TTL.get(kind) if ttl is _KIND_TTL else ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logging.warning(f"キャッシュの読み込みに失敗: {self.path} - {str(e)}")
+            return
+
+        if isinstance(data, dict) and data.get("format") == FORMAT_VERSION:
+            self.entries = OrderedDict(data["entries"])
+            return
+
+        # 旧形式: 保存時刻がないのでファイルの更新時刻を使う
+        saved_at = self.path.stat().st_mtime
+        if isinstance(data, list):
+            data = {entry["code"]: entry for entry in data}
+        self.entries = OrderedDict((key, (saved_at, value)) for key, value in (data or {}).items())
+        self.dirty = True
+
+    def is_fresh(self, key, now=None):
+        if key not in self.entries:
+            return False
+        if self.ttl is None:
+            return True
+        saved_at, _ = self.entries[key]
+        return (now or time.time()) - saved_at < self.ttl
+
+    def stale_keys(self, keys):
+        now = time.time()
+        return [key for key in dict.fromkeys(keys) if not self.is_fresh(key, now)]
+
+    def __contains__(self, key):
+        return self.is_fresh(key)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keys(self):
+        return list(self.entries)
+
+    def get(self, key, default=None, allow_stale=False):
+        # allow_stale は取り直しに失敗したときの代替読み出しなのでヒット率には数えない
+        fresh = self.is_fresh(key)
+        if not allow_stale:
+            instrument.cache_lookup(self.kind, fresh)
+        if key not in self.entries or not (allow_stale or fresh):
+            return default
+        self.entries.move_to_end(key)
+        return self.entries[key][1]
+
+    def set(self, key, value, saved_at=None):
+        self.entries[key] = (saved_at or time.time(), value)
+        self.entries.move_to_end(key)
+        self.dirty = True
+        if self.max_entries:
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def update(self, mapping):
+        saved_at = time.time()
+        for key, value in mapping.items():
+            self.set(key, value, saved_at)
+
+    def discard(self, key):
+        if self.entries.pop(key, None) is not None:
+            self.dirty = True
+
+    def as_dict(self, allow_stale=True):
+        now = time.time()
+        return {
+            key: value for key, (_, value) in self.entries.items()
+            if allow_stale or self.is_fresh(key, now)
+        }
+
+    def refresh(self, keys, fetch_many):
+        """keys のうち期限切れ・未取得のものだけ fetch_many(keys) -> dict で取り直す"""
+        stale = self.stale_keys(keys)
+        instrument.count(f"cache.{self.kind}.hit", len(dict.fromkeys(keys)) - len(stale))
+        instrument.count(f"cache.{self.kind}.miss", len(stale))
+        if not stale:
+            return 0
+        fetched = fetch_many(stale) or {}
+        self.update(fetched)
+        return len(fetched)
+
+    def save(self, force=False):
+        if not (self.dirty or force):
+            return
+        data = {"format": FORMAT_VERSION, "kind": self.kind, "entries": list(self.entries.items())}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        mode = self.path.stat().st_mode & 0o777 if self.path.exists() else 0o644
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(data, f)
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.dirty = False
@@ -0,0 +1,69 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import instrument
+
+
+class TokenBucket:
+    """rate 回/秒・最大 capacity 回までのバーストを許すレート制限（スレッドセーフ）"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def backoff_delay(attempt, base_delay, max_delay=30):
+    # 指数バックオフの半分を固定、残り半分をジッターにする
+    delay = min(max_delay, base_delay * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def call_with_retry(func, *args, retry_count=3, base_delay=1, limiter=None, label=""):
+    for attempt in range(retry_count):
+        if limiter:
+            limiter.acquire()
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt == retry_count - 1:
+                raise
+            delay = backoff_delay(attempt, base_delay)
+            instrument.count("retries")
+            logging.info(f"再試行: {label} ({attempt + 1}/{retry_count}) {delay:.1f}秒後 - {str(e)}")
+            time.sleep(delay)
+
+
+def run_concurrently(func, items, max_workers=8):
+    """items の各要素に func を並列適用し、入力順の結果リストを返す
+
+    例外は要素ごとに握りつぶして警告を出し、その要素の結果は None にする。
+    """
+    def run(item):
+        try:
+            return func(item)
+        except Exception as e:
+            logging.warning(f"警告: {item} の処理に失敗 - {str(e)}")
+            return None
+
+    if max_workers <= 1 or len(items) <= 1:
+        return [run(item) for item in items]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run, items))
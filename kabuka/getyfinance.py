@@ -1,12 +1,20 @@
 import yfinance as yf
+import numpy as np
+from bisect import bisect_right
 from datetime import datetime, timedelta
 import calendar
+import html
+import io
 import os
 import logging
-import pickle
 from pathlib import Path
-import time
-import pandas as pd
+
+import instrument
+import jpx_calendar
+from fetch_pool import TokenBucket, call_with_retry, run_concurrently
+from master_index import StockIndex
+from price_source import FixtureSource, YFinanceSource, fetch_closes
+from price_store import PriceStore, import_legacy_cache
 
 # ロギング設定
 logging.basicConfig(
@@ -21,8 +29,18 @@ logging.basicConfig(
 CONFIG = {
     'RETRY_COUNT': 3,
     'SLEEP_TIME': 1,
+    'MAX_WORKERS': 8,
+    'RATE_LIMIT': 2,
+    'RATE_BURST': 4,
     'CACHE_ENABLED': True,
+    'FULL_HISTORY': True,
+    'BATCH_SIZE': 50,
+    'PRICE_FIXTURE_DIR': None,
     'YF_CACHE_FILE': 'yf_cache.pkl',
+    'PRICE_DB_FILE': 'prices.db',
+    'WINDOW_MODE': 'calendar',  # 'calendar': 従来の暦日 / 'trading': 東証の営業日で数える（数値が変わる）
+    'FIRST_DAYS': 7,            # 'trading' で月初から数える営業日数
+    'RIGHTS_DAYS': 5,           # 'trading' で権利付最終日まで遡る営業日数
     'COLOR_THRESHOLDS': {
         80: 'below80',
         90: 'below90',
@@ -32,31 +50,38 @@ CONFIG = {
     }
 }
 
-def get_cached_data(file_path):
-    if Path(file_path).exists():
-        try:
-            with open(file_path, 'rb') as f:
-                return pickle.load(f)
-        except Exception as e:
-            logging.warning(f"キャッシュの読み込みに失敗: {str(e)}")
-    return None
-
-def save_cached_data(data, file_path):
-    try:
-        with open(file_path, 'wb') as f:
-            pickle.dump(data, f)
-    except Exception as e:
-        logging.warning(f"キャッシュの保存に失敗: {str(e)}")
-
 def load_name_dict_from_excel(file_path="data_j.xls"):
-    df = pd.read_excel(file_path, engine="xlrd", dtype=str)
-    df = df[["コード", "銘柄名"]].dropna()
-    return dict(zip(df["コード"], df["銘柄名"]))
+    # XLS は変更時だけ data_j.db に索引化し、以降はそこから遅延ロードする
+    return StockIndex(file_path, Path(file_path).with_suffix(".db"))
 
 def get_company_name(ticker, name_dict):
     return name_dict.get(ticker, ticker)
 
-def get_average_price(ticker, year, month, is_first_decade=True):
+_rate_limiter = None
+
+def get_rate_limiter():
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = TokenBucket(CONFIG['RATE_LIMIT'], CONFIG['RATE_BURST'])
+    return _rate_limiter
+
+def get_trading_calendar(*years):
+    return jpx_calendar.get_calendar(*years)
+
+def get_window_settings():
+    return CONFIG['WINDOW_MODE'], CONFIG['FIRST_DAYS'], CONFIG['RIGHTS_DAYS']
+
+def get_window_position(trading_calendar, year, month, is_first_decade=True):
+    # 営業日の配列上の位置 [start, end)（月初 N 営業日 / 権利付最終日までの N 営業日）
+    if is_first_decade:
+        return trading_calendar.first_days(year, month, CONFIG['FIRST_DAYS'])
+    return trading_calendar.days_until_rights(year, month, CONFIG['RIGHTS_DAYS'])
+
+def get_window(year, month, is_first_decade=True):
+    if CONFIG['WINDOW_MODE'] == 'trading':
+        trading_calendar = get_trading_calendar(year)
+        return trading_calendar.window_dates(*get_window_position(trading_calendar, year, month, is_first_decade))
+
     if is_first_decade:
         start_date = f"{year}-{month:02d}-01"
         end_date = f"{year}-{month:02d}-10"
@@ -65,32 +90,164 @@ def get_average_price(ticker, year, month, is_first_decade=True):
         end_date = f"{year}-{month:02d}-{last_day}"
         start_date = datetime.strptime(end_date, "%Y-%m-%d") - timedelta(days=7)
         start_date = start_date.strftime("%Y-%m-%d")
+    return start_date, end_date
 
-    for attempt in range(CONFIG['RETRY_COUNT']):
-        try:
-            stock = yf.Ticker(f"{ticker}.T")
-            df = stock.history(start=start_date, end=end_date)
-            if df.empty:
-                return None
-            return df['Close'].mean()
-        except Exception as e:
-            if attempt == CONFIG['RETRY_COUNT'] - 1:
-                logging.warning(f"警告: {ticker}の株価取得に失敗 - {str(e)}")
-                return None
-            time.sleep(CONFIG['SLEEP_TIME'])
+@instrument.timed("get_average_price")
+def get_average_price(ticker, year, month, is_first_decade=True):
+    start_date, end_date = get_window(year, month, is_first_decade)
 
-def get_css_class(percentage):
-    for threshold, css in CONFIG['COLOR_THRESHOLDS'].items():
-        if percentage < threshold:
-            return css
-    return "above120"
+    def fetch():
+        instrument.count("yfinance.requests")
+        stock = yf.Ticker(f"{ticker}.T")
+        return stock.history(start=start_date, end=end_date)
 
-def create_html_output(companies_data, year, month, name_dict, display_order):
-    html_content = """
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <style>
+    try:
+        df = call_with_retry(
+            fetch,
+            retry_count=CONFIG['RETRY_COUNT'],
+            base_delay=CONFIG['SLEEP_TIME'],
+            limiter=get_rate_limiter(),
+            label=ticker,
+        )
+    except Exception as e:
+        logging.warning(f"警告: {ticker}の株価取得に失敗 - {str(e)}")
+        return None
+    if df.empty:
+        return None
+    return df['Close'].mean()
+
+def get_target_months(year, month):
+    # 権利月の3ヶ月前から翌月まで（年跨ぎを補正）
+    targets = []
+    for m in range(month-3, month+2):
+        target_year = year
+        target_month = m
+
+        if m <= 0:
+            target_month += 12
+            target_year -= 1
+        elif m > 12:
+            target_month -= 12
+            target_year += 1
+
+        targets.append((target_year, target_month))
+    return targets
+
+def get_history_range(year, month):
+    # 4年分の全ウィンドウを覆う期間（history() と同じく end は含まない）
+    windows = []
+    for y in range(year-3, year+1):
+        windows.append(get_window(y, month, False))
+        for target_year, target_month in get_target_months(y, month):
+            windows.append(get_window(target_year, target_month))
+    return min(w[0] for w in windows), max(w[1] for w in windows)
+
+def get_price_source():
+    if CONFIG['PRICE_FIXTURE_DIR']:
+        return FixtureSource(CONFIG['PRICE_FIXTURE_DIR'])
+    return YFinanceSource()
+
+def get_price_histories(tickers, start_date, end_date, source=None, empty=None):
+    return fetch_closes(
+        tickers, start_date, end_date,
+        source or get_price_source(),
+        chunk_size=CONFIG['BATCH_SIZE'],
+        retry_count=CONFIG['RETRY_COUNT'],
+        sleep_time=CONFIG['SLEEP_TIME'],
+        max_workers=CONFIG['MAX_WORKERS'],
+        limiter=get_rate_limiter(),
+        empty=empty,
+    )
+
+def _fetch_into_store(store, groups, source=None):
+    # {(start, end): 銘柄リスト} を期間ごとにまとめて取得して追記し、調整が変わっていた銘柄を返す
+    readjusted = []
+    for (missing_start, missing_end), group in groups.items():
+        logging.info(f"株価取得: {len(group)}件 {missing_start}〜{missing_end}")
+        empty = set()
+        fetched = get_price_histories(group, missing_start, missing_end, source, empty)
+        for ticker, closes in fetched.items():
+            if not store.append_closes(ticker, closes, missing_start, missing_end):
+                readjusted.append(ticker)
+        # 取得元が足のないことを確かめた銘柄（上場前・上場廃止・売買停止）だけを、毎回取りに行かないよう記録する。
+        # 取得に失敗した銘柄は何も記録せず、次回また取りに行く
+        for ticker in empty:
+            store.mark_empty(ticker, missing_start, missing_end)
+    return readjusted
+
+def load_price_histories(store, tickers, start_date, end_date, source=None):
+    # 未取得の期間だけをまとめて取得し、ストアに追記してから読み出す
+    groups = {}
+    for ticker in tickers:
+        missing_ranges = store.missing_ranges(ticker, start_date, end_date)
+        instrument.cache_lookup("price_store", not missing_ranges)
+        for missing in missing_ranges:
+            # 保存済みの足を1本含めて取り、調整後の終値が前回から変わっていないか確かめる
+            groups.setdefault(store.extend_to_stored_bar(ticker, *missing), []).append(ticker)
+
+    readjusted = _fetch_into_store(store, groups, source)
+    if readjusted:
+        # 分割・配当で過去の終値が変わった銘柄は、ストアから捨てたので全期間を取り直す
+        logging.info(f"調整後の終値が変わったため取り直します: {len(readjusted)}件")
+        instrument.count("prices.readjusted", len(readjusted))
+        _fetch_into_store(store, {(start_date, end_date): readjusted}, source)
+    return read_price_histories(store, tickers, start_date, end_date)
+
+def read_price_histories(store, tickers, start_date, end_date):
+    # ストアにある日足だけを読む（取得しない）
+    histories = {}
+    for ticker in tickers:
+        closes = store.read_closes(ticker, start_date, end_date)
+        if closes is not None:
+            histories[ticker] = closes
+    return histories
+
+def get_price_history(ticker, start_date, end_date, source=None):
+    return get_price_histories([ticker], start_date, end_date, source).get(ticker)
+
+def get_average_price_from_history(closes, year, month, is_first_decade=True):
+    if closes is None:
+        return None
+    start_date, end_date = get_window(year, month, is_first_decade)
+    window = closes[(closes.index >= start_date) & (closes.index < end_date)]
+    if window.empty:
+        return None
+    return window.mean()
+
+def get_average_price_from_bars(bars, trading_calendar, year, month, is_first_decade=True):
+    # bars は trading_calendar.align() で営業日に並べた終値。ウィンドウは配列のスライスで取る
+    window = bars[slice(*get_window_position(trading_calendar, year, month, is_first_decade))]
+    window = window[~np.isnan(window)]
+    if not len(window):
+        return None
+    return window.mean()
+
+def build_company_data(code, year, month, name_dict, price_func):
+    company_data = {"code": code, "name": get_company_name(code, name_dict)}
+
+    for y in range(year-3, year+1):
+        yearly_data = []
+        rights_price = price_func(y, month, False)
+        if rights_price is None:
+            continue
+
+        company_data[f"{y}_rights_price"] = rights_price
+
+        for target_year, target_month in get_target_months(y, month):
+            avg_price = price_func(target_year, target_month)
+            if avg_price is not None:
+                percentage = (avg_price / rights_price) * 100
+                yearly_data.append({
+                    "price": avg_price,
+                    "percentage": percentage
+                })
+
+        if yearly_data:
+            company_data[str(y)] = yearly_data
+
+    return company_data
+
+REPORT_STYLE = """
             table {
                 border-collapse: collapse;
                 margin: 20px 0;
@@ -115,167 +272,200 @@ def create_html_output(companies_data, year, month, name_dict, display_order):
                 font-size: 18px;
                 margin: 20px 0 10px 0;
             }
-        </style>
+        """
+
+HTML_HEADER = f"""
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <style>{REPORT_STYLE}</style>
     </head>
     <body>
     """
 
+# 優待情報入りの最終版（add_yutai_info.py が BeautifulSoup で書き出していた形と同じ）
+FINAL_HTML_HEADER = f"""
+<html>
+<head>
+<meta charset="utf-8"/>
+<style>{REPORT_STYLE}</style>
+</head>
+<body>
+"""
+
+HTML_FOOTER = "</body></html>"
+
+def get_css_class(percentage):
+    # COLOR_THRESHOLDS は昇順なので、percentage より大きい最初の閾値を二分探索で求める
+    thresholds = CONFIG['COLOR_THRESHOLDS']
+    index = bisect_right(list(thresholds), percentage)
+    if index < len(thresholds):
+        return list(thresholds.values())[index]
+    return "above120"
+
+def make_css_classifier():
+    keys = list(CONFIG['COLOR_THRESHOLDS'])
+    classes = list(CONFIG['COLOR_THRESHOLDS'].values()) + ["above120"]
+    return lambda percentage: classes[bisect_right(keys, percentage)]
+
+def render_header_row(month):
+    parts = ["<table>\n<tr>\n<th>年</th>\n"]
+    for m in range(month-3, month+1):
+        adj_month = m if 1 <= m <= 12 else (m + 12 if m <= 0 else m - 12)
+        parts.append(f"<th>{adj_month:02d}</th>\n")
+    parts.append("<th>基準</th>\n")
+    parts.append(f"<th>{(month+1 if month < 12 else 1):02d}</th>\n")
+    parts.append("</tr>\n")
+    return "".join(parts)
+
+def render_yutai_table(info):
+    # 優待内容 / 配当利回り・最低投資金額 / 優待発生株数・権利確定月・日 の3行
+    cells = {key: html.escape(str(value), quote=False) for key, value in info.items()}
+    return (
+        '<table border="1" class="yutai-info-table" style="margin-bottom: 1em; border-collapse: collapse;">'
+        f'<tr><th>優待内容</th><td colspan="3">{cells["優待内容"]}（{cells["優待利回り"]}）</td></tr>'
+        f'<tr><th>配当利回り</th><td>{cells["配当利回り"]}</td>'
+        f'<th>最低投資金額</th><td>{cells["最低投資金額"]}</td></tr>'
+        f'<tr><th>優待発生株数</th><td>{cells["優待発生株数"]}</td>'
+        f'<th>優待権利確定月・日</th><td>{cells["優待権利確定月"]}／{cells["権利確定日"]}</td></tr>'
+        '</table>'
+    )
+
+def render_company(company, year, name_dict, header_row, classify, final=False, yutai_info=None):
+    # final=True では優待情報の表を社名の直後に入れ、最終版の書式で出力する
+    name = get_company_name(company["code"], name_dict)
+    if final:
+        name = html.escape(name, quote=False)
+    parts = [f'<div class="company-name">{name}({company["code"]})</div>']
+    if yutai_info:
+        parts.append(render_yutai_table(yutai_info))
+    parts.append("\n")
+    parts.append(header_row)
+    no_data = '<td colspan="6">データなし</td>\n</tr>\n' if final else "<td colspan='6'>データなし</td>\n</tr>\n"
+
+    def price_cell(price_data, column):
+        percentage = price_data["percentage"]
+        percentages[column].append(percentage)
+        return f'<td class="{classify(percentage)}">{price_data["price"]:.2f}({percentage:.1f}%)</td>\n'
+
+    percentages = [[] for _ in range(5)]
+    years = list(range(year-3, year+1))
+    years.reverse()
+
+    for y in years:
+        parts.append(f"<tr>\n<td>{y}</td>\n")
+        yearly_data = company.get(str(y), [])
+        rights_price = company.get(f"{y}_rights_price")
+
+        if not yearly_data or rights_price is None:
+            parts.append(no_data)
+            continue
+
+        for i in range(4):
+            parts.append(price_cell(yearly_data[i], i) if i < len(yearly_data) else "<td>-</td>\n")
+        parts.append(f'<td>{rights_price:.2f}</td>\n')
+        parts.append(price_cell(yearly_data[4], 4) if len(yearly_data) > 4 else "<td>-</td>\n")
+        parts.append("</tr>\n")
+
+    def average_cell(month_percentages):
+        if not month_percentages:
+            return "<td>-</td>\n"
+        avg_percentage = sum(month_percentages) / len(month_percentages)
+        return f'<td class="{classify(avg_percentage)}">({avg_percentage:.1f}%)</td>\n'
+
+    parts.append("<tr>\n<td>平均</td>\n")
+    parts.extend(average_cell(month_percentages) for month_percentages in percentages[:4])
+    parts.append("<td>基準</td>\n")
+    parts.append(average_cell(percentages[4]))
+    parts.append("</tr>\n</table>\n")
+    return "".join(parts)
+
+def write_html_output(out, companies_data, year, month, name_dict, display_order, yutai_data=None):
+    # 銘柄ごとの断片を順に書き出し、レポート全体を文字列として組み立てない
+    # yutai_data（code → 優待情報）を渡すと、優待情報入りの最終版を1回で書き出す
     company_map = {company["code"]: company for company in companies_data}
+    header_row = render_header_row(month)
+    classify = make_css_classifier()
+    final = yutai_data is not None
 
+    out.write(FINAL_HTML_HEADER if final else HTML_HEADER)
     for code in display_order:
         company = company_map.get(code)
         if not company:
             continue
+        yutai_info = yutai_data.get(code) if final else None
+        out.write(render_company(company, year, name_dict, header_row, classify, final, yutai_info))
+    out.write(HTML_FOOTER)
 
-        name = get_company_name(company["code"], name_dict)
-        html_content += f'<div class="company-name">{name}({company["code"]})</div>\n'
-        html_content += "<table>\n<tr>\n<th>年</th>\n"
-        for m in range(month-3, month+1):
-            adj_month = m if 1 <= m <= 12 else (m + 12 if m <= 0 else m - 12)
-            html_content += f"<th>{adj_month:02d}</th>\n"
-        html_content += "<th>基準</th>\n"
-        html_content += f"<th>{(month+1 if month < 12 else 1):02d}</th>\n"
-        html_content += "</tr>\n"
-
-        percentages = [[] for _ in range(5)]
-        years = list(range(year-3, year+1))
-        years.reverse()
-
-        for y in years:
-            html_content += f"<tr>\n<td>{y}</td>\n"
-            yearly_data = company.get(str(y), [])
-            rights_price = company.get(f"{y}_rights_price")
-
-            if not yearly_data or rights_price is None:
-                html_content += "<td colspan='6'>データなし</td>\n</tr>\n"
-                continue
-
-            for i in range(3):
-                if i < len(yearly_data):
-                    price_data = yearly_data[i]
-                    percentage = price_data["percentage"]
-                    price = price_data["price"]
-                    css_class = get_css_class(percentage)
-                    html_content += f'<td class="{css_class}">{price:.2f}({percentage:.1f}%)</td>\n'
-                    percentages[i].append(percentage)
-                else:
-                    html_content += "<td>-</td>\n"
-
-            if len(yearly_data) > 3:
-                march_data = yearly_data[3]
-                percentage = march_data["percentage"]
-                price = march_data["price"]
-                css_class = get_css_class(percentage)
-                html_content += f'<td class="{css_class}">{price:.2f}({percentage:.1f}%)</td>\n'
-                percentages[3].append(percentage)
-            else:
-                html_content += "<td>-</td>\n"
-
-            html_content += f'<td>{rights_price:.2f}</td>\n'
-
-            if len(yearly_data) > 4:
-                april_data = yearly_data[4]
-                percentage = april_data["percentage"]
-                price = april_data["price"]
-                css_class = get_css_class(percentage)
-                html_content += f'<td class="{css_class}">{price:.2f}({percentage:.1f}%)</td>\n'
-                percentages[4].append(percentage)
-            else:
-                html_content += "<td>-</td>\n"
-
-            html_content += "</tr>\n"
-
-        html_content += "<tr>\n<td>平均</td>\n"
-        for month_percentages in percentages[:4]:
-            if month_percentages:
-                avg_percentage = sum(month_percentages) / len(month_percentages)
-                css_class = get_css_class(avg_percentage)
-                html_content += f'<td class="{css_class}">({avg_percentage:.1f}%)</td>\n'
-            else:
-                html_content += "<td>-</td>\n"
-
-        html_content += "<td>基準</td>\n"
-        if percentages[4]:
-            avg_percentage = sum(percentages[4]) / len(percentages[4])
-            css_class = get_css_class(avg_percentage)
-            html_content += f'<td class="{css_class}">({avg_percentage:.1f}%)</td>\n'
-        else:
-            html_content += "<td>-</td>\n"
-
-        html_content += "</tr>\n</table>\n"
-
-    html_content += "</body></html>"
-    return html_content
-
-def main():
-    input_file = input("入力ファイル名を入力してください: ")
-    year = int(input("年を入力してください (例: 2024): "))
-    month = int(input("月を入力してください (1-12): "))
-
-    name_dict = load_name_dict_from_excel()
-
-    output_dir = str(year)
-    os.makedirs(output_dir, exist_ok=True)
-    output_file = f"{output_dir}/{month:02d}_output.html"
+def create_html_output(companies_data, year, month, name_dict, display_order, yutai_data=None):
+    buffer = io.StringIO()
+    write_html_output(buffer, companies_data, year, month, name_dict, display_order, yutai_data)
+    return buffer.getvalue()
 
+def load_codes(input_file):
     with open(input_file, 'r') as f:
-        codes = [line.strip() for line in f if line.strip()]
-
-    yf_cache = get_cached_data(CONFIG['YF_CACHE_FILE']) or []
-    existing_codes = {entry['code']: entry for entry in yf_cache}
+        return [line.strip() for line in f if line.strip()]
+
+def build_company_from_history(code, year, month, name_dict, closes, store=None):
+    # 日足が取れなかった銘柄は旧キャッシュの同じ (年, 月) の結果で代用する
+    if closes is None and store is not None:
+        legacy = store.get_legacy_report(code, year, month)
+        if legacy:
+            logging.info(f"旧キャッシュを使用: {code}")
+            return legacy
+
+    # 全期間の日足はメモリ上で各ウィンドウに切り出す
+    if CONFIG['WINDOW_MODE'] == 'trading' and closes is not None:
+        trading_calendar = get_trading_calendar(year - 3, year + 1)
+        bars = trading_calendar.align(closes)
+        price_func = lambda y, m, first=True: get_average_price_from_bars(bars, trading_calendar, y, m, first)
+    else:
+        price_func = lambda y, m, first=True: get_average_price_from_history(closes, y, m, first)
+    return build_company_data(code, year, month, name_dict, price_func)
 
+def collect_companies_data(codes, year, month, name_dict, store):
     total_codes = len(codes)
-    updated = False
-
-    for i, code in enumerate(codes, 1):
-        if code in existing_codes:
-            logging.info(f"スキップ: {code} (キャッシュ済み)")
-            continue
+    histories = {}
+    if CONFIG['FULL_HISTORY']:
+        histories = load_price_histories(store, codes, *get_history_range(year, month))
 
+    def build(item):
+        i, code = item
         logging.info(f"処理中: {code} ({i}/{total_codes})")
-        company_data = {"code": code, "name": get_company_name(code, name_dict)}
-
-        for y in range(year-3, year+1):
-            yearly_data = []
-            rights_price = get_average_price(code, y, month, False)
-            if rights_price is None:
-                continue
 
-            company_data[f"{y}_rights_price"] = rights_price
+        if CONFIG['FULL_HISTORY']:
+            return build_company_from_history(code, year, month, name_dict, histories.get(code), store)
 
-            for m in range(month-3, month+2):
-                target_year = y
-                target_month = m
+        price_func = lambda y, m, first=True: get_average_price(code, y, m, first)
+        return build_company_data(code, year, month, name_dict, price_func)
 
-                if m <= 0:
-                    target_month += 12
-                    target_year -= 1
-                elif m > 12:
-                    target_month -= 12
-                    target_year += 1
+    # 日足はメモリ上にあるので逐次、ウィンドウ毎の取得時は銘柄単位で並列に処理する
+    max_workers = 1 if CONFIG['FULL_HISTORY'] else CONFIG['MAX_WORKERS']
+    companies_data = run_concurrently(build, list(enumerate(codes, 1)), max_workers)
+    return [company for company in companies_data if company]
 
-                avg_price = get_average_price(code, target_year, target_month)
-                if avg_price is not None:
-                    percentage = (avg_price / rights_price) * 100
-                    yearly_data.append({
-                        "price": avg_price,
-                        "percentage": percentage
-                    })
+def generate_report(codes, year, month, name_dict, store, output_file=None):
+    output_file = output_file or f"{year}/{month:02d}_output.html"
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
 
-            if yearly_data:
-                company_data[str(y)] = yearly_data
+    companies_data = collect_companies_data(codes, year, month, name_dict, store)
 
-        if len(company_data) > 1:
-            yf_cache.append(company_data)
-            updated = True
+    with open(output_file, 'w', encoding='utf-8') as f:
+        write_html_output(f, companies_data, year, month, name_dict, codes)
+    return output_file
 
-    if updated:
-        save_cached_data(yf_cache, CONFIG['YF_CACHE_FILE'])
+def main():
+    input_file = input("入力ファイル名を入力してください: ")
+    year = int(input("年を入力してください (例: 2024): "))
+    month = int(input("月を入力してください (1-12): "))
 
-    companies_data = [entry for entry in yf_cache if entry['code'] in codes]
+    name_dict = load_name_dict_from_excel()
+    codes = load_codes(input_file)
 
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(create_html_output(companies_data, year, month, name_dict, codes))
+    store = PriceStore(CONFIG['PRICE_DB_FILE'])
+    import_legacy_cache(store, CONFIG['YF_CACHE_FILE'])
+    output_file = generate_report(codes, year, month, name_dict, store)
+    store.close()
 
     print(f"処理が完了しました。{output_file} を確認してください。")
 
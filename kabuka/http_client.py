@@ -0,0 +1,177 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import instrument
+
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+REQUEST_TIMEOUT = (5, 20)  # (接続, 読み込み) 秒
+POOL_SIZE = 16
+RETRY_COUNT = 3
+
+# 取得したページの本文（gzip）と検証子（ETag / Last-Modified）、解析結果の保存先
+RESPONSE_CACHE_DIR = Path(__file__).resolve().parent / "http_cache"
+
+_session = None
+_session_lock = threading.Lock()
+_response_cache = None
+
+
+def make_session(pool_size=POOL_SIZE, retry_count=RETRY_COUNT):
+    # 接続を使い回し、429/5xx は指数バックオフで再試行する
+    retry = Retry(
+        total=retry_count,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+
+def fetch(url, limiter=None, timeout=REQUEST_TIMEOUT, session=None, headers=None):
+    if limiter:
+        limiter.acquire()
+    instrument.count("http.requests")
+    try:
+        with instrument.timer("http.request"):
+            res = (session or get_session()).get(url, timeout=timeout, headers=headers)
+    except requests.RequestException:
+        instrument.count("http.errors")
+        raise
+    instrument.count("http.bytes", len(res.content))
+    if res.status_code != 200:
+        instrument.count(f"http.status.{res.status_code}")
+    return res
+
+
+class ResponseCache:
+    """URL ごとに本文・検証子・解析結果を1つの gzip 圧縮 JSON として保存する"""
+
+    def __init__(self, path=RESPONSE_CACHE_DIR):
+        self.path = Path(path)
+
+    def file_path(self, url):
+        return self.path / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.json.gz"
+
+    def get(self, url):
+        try:
+            with gzip.open(self.file_path(url), "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError):
+            # 壊れたファイルは無視して取り直す
+            return None
+        return entry if entry.get("url") == url else None
+
+    def set(self, url, entry):
+        self.path.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=".tmp.")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self.file_path(url))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def get_response_cache():
+    global _response_cache
+    with _session_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
+
+
+class CachedResponse:
+    """fetch_cached() の結果。304 のときは保存済みの本文と解析結果をそのまま使う"""
+
+    def __init__(self, url, status_code, entry, not_modified=False, cache=None):
+        self.url = url
+        self.status_code = status_code
+        self.entry = entry
+        self.not_modified = not_modified
+        self.cache = cache
+
+    @property
+    def text(self):
+        return self.entry["text"]
+
+    def parse(self, func, key=None):
+        """func(text) の結果を返す。本文が前回と同じなら保存済みの結果を使い、解析しない
+
+        結果は JSON で保存するので、func は JSON にできる値を返すこと。
+        """
+        key = key or f"{func.__module__}.{func.__qualname__}"
+        parsed = self.entry.setdefault("parsed", {})
+        instrument.cache_lookup("http_parse", key in parsed)
+        if key not in parsed:
+            parsed[key] = func(self.text)
+            if self.cache is not None:
+                self.cache.set(self.url, self.entry)
+        return parsed[key]
+
+
+def fetch_cached(url, limiter=None, timeout=REQUEST_TIMEOUT, session=None, cache=None):
+    """前回の ETag / Last-Modified を付けて条件付きで取得する
+
+    304 なら本文を受け取らずに保存済みのものを返す。200 なら本文を保存し直す
+    （本文が前回と同じなら解析結果も引き継ぐ）。それ以外の応答は保存しない。
+    """
+    cache = cache or get_response_cache()
+    entry = cache.get(url)
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    res = fetch(url, limiter, timeout, session, headers or None)
+    if res.status_code == 304 and entry:
+        instrument.cache_lookup("http_response", True)
+        return CachedResponse(url, 200, entry, not_modified=True, cache=cache)
+    instrument.cache_lookup("http_response", False)
+    if res.status_code != 200:
+        return CachedResponse(url, res.status_code, {"text": res.text})
+
+    text = res.text
+    body_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    new_entry = {
+        "url": url,
+        "etag": res.headers.get("ETag"),
+        "last_modified": res.headers.get("Last-Modified"),
+        "fetched_at": time.time(),
+        "sha1": body_hash,
+        "text": text,
+        # 本文が前回と同じなら解析結果は使い回せる
+        "parsed": entry["parsed"] if entry and entry.get("sha1") == body_hash else {},
+    }
+    cache.set(url, new_entry)
+    return CachedResponse(url, 200, new_entry, cache=cache)
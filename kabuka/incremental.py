@@ -0,0 +1,126 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import getyfinance
+import instrument
+import report_data
+from cache_store import Cache
+
+# レポートの HTML 構造を変えたら上げる（全断片が作り直しになる）
+RENDER_VERSION = 2
+
+MONTH_KEY = "__month__"
+
+
+def digest(*values):
+    hasher = hashlib.sha1()
+    for value in values:
+        hasher.update(json.dumps(value, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def closes_digest(closes):
+    if closes is None:
+        return None
+    hasher = hashlib.sha1()
+    hasher.update(closes.index.values.tobytes())
+    hasher.update(closes.values.astype("float64").tobytes())
+    return hasher.hexdigest()
+
+
+def build_state_path(year, month):
+    return Path(str(year)) / ".build" / f"{month:02d}.pkl"
+
+
+def write_if_changed(path, content):
+    # 内容が同じならファイルに触らない（更新時刻も変えない）
+    path = Path(path)
+    if path.exists() and path.read_text(encoding="utf-8") == content:
+        return False
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(content, encoding="utf-8")
+    os.replace(tmp_path, path)
+    return True
+
+
+def generate_report(codes, year, month, name_dict, store, output_file, yutai_data=None, force=False, fetch=True):
+    """入力（銘柄リスト・日足・優待情報）のハッシュが変わった銘柄の断片だけを作り直す
+
+    yutai_data（銘柄コード → 優待情報、add_yutai_info.merge_yutai_info の値）を
+    渡すと優待情報の表を各銘柄の断片に直接描画し、最終版
+    （NN_final.html と同じ形）を output_file に書き出す。ビューア用の JSON も
+    {year}/data/ に書き出す（report_data.month_files）。断片は
+    {year}/.build/{MM}.pkl に入力ハッシュをキーにして保存する。月全体の
+    ハッシュが前回と同じで出力ファイルもあれば、その月は何もしない。
+    fetch=False なら日足を取得せず、store にあるものだけを使う。
+    戻り値は作り直した場合 True。
+    """
+    state = Cache(build_state_path(year, month), "report_fragment", ttl=None)
+    load_histories = getyfinance.load_price_histories if fetch else getyfinance.read_price_histories
+    histories = load_histories(store, codes, *getyfinance.get_history_range(year, month))
+
+    final = yutai_data is not None
+    yutai_data = yutai_data or {}
+
+    keys = {}
+    for code in codes:
+        keys[code] = digest(
+            RENDER_VERSION, getyfinance.get_window_settings(), year, month, code,
+            getyfinance.get_company_name(code, name_dict),
+            closes_digest(histories.get(code)),
+            final, yutai_data.get(code),
+        )
+    month_key = digest(codes, [keys[code] for code in codes])
+
+    outputs = [output_file, report_data.index_path(year, month)]
+    if not force and state.get(MONTH_KEY) == month_key and all(Path(p).exists() for p in outputs):
+        logging.info(f"変更なし: {year}/{month:02d}")
+        return False
+
+    header_row = getyfinance.render_header_row(month)
+    classify = getyfinance.make_css_classifier()
+    parts = [getyfinance.FINAL_HTML_HEADER if final else getyfinance.HTML_HEADER]
+    records = []
+    rebuilt = 0
+    for code in codes:
+        # 断片は (HTML, ビューア用のデータ) の組で保存する
+        entry = None if force else state.get(keys[code])
+        if entry is None:
+            with instrument.timer("build.company"):
+                company = getyfinance.build_company_from_history(code, year, month, name_dict, histories.get(code), store)
+            with instrument.timer("render.company"):
+                entry = (
+                    getyfinance.render_company(company, year, name_dict, header_row, classify, final, yutai_data.get(code)),
+                    report_data.company_record(company, year, getyfinance.get_company_name(code, name_dict), yutai_data.get(code)),
+                )
+            rebuilt += 1
+        state.set(keys[code], entry)
+        parts.append(entry[0])
+        records.append(entry[1])
+    parts.append(getyfinance.HTML_FOOTER)
+
+    with instrument.timer("render.write"):
+        os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+        write_if_changed(output_file, "".join(parts))
+
+        data_files = report_data.month_files(year, month, records)
+        os.makedirs(report_data.data_dir(year), exist_ok=True)
+        for path, content in data_files.items():
+            write_if_changed(path, content)
+        for path in report_data.stale_shards(year, month, data_files):
+            path.unlink()
+
+    # 今回使わなかった断片は捨てる
+    used = set(keys.values())
+    for key in state.keys():
+        if key != MONTH_KEY and key not in used:
+            state.discard(key)
+    state.set(MONTH_KEY, month_key)
+    state.save()
+
+    logging.info(f"更新: {year}/{month:02d} ({rebuilt}/{len(keys)} 銘柄を再生成)")
+    return True
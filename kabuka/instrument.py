@@ -0,0 +1,130 @@
+import cProfile
+import functools
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+# プロセス内で共有する計測値。ProcessPoolExecutor の各プロセスは snapshot() を返し、親が merge() する
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timers = defaultdict(lambda: [0, 0.0, 0.0])  # name → [回数, 合計秒, 最大秒]
+
+
+def count(name, n=1):
+    with _lock:
+        _counters[name] += n
+
+
+def add_time(name, seconds):
+    with _lock:
+        entry = _timers[name]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+
+
+@contextmanager
+def timer(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """関数の呼び出し回数と時間を name で記録するデコレータ"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def cache_lookup(kind, hit):
+    count(f"cache.{kind}.{'hit' if hit else 'miss'}")
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def snapshot():
+    with _lock:
+        return {"counters": dict(_counters), "timers": {name: list(entry) for name, entry in _timers.items()}}
+
+
+def merge(data):
+    with _lock:
+        for name, n in data["counters"].items():
+            _counters[name] += n
+        for name, (calls, total, longest) in data["timers"].items():
+            entry = _timers[name]
+            entry[0] += calls
+            entry[1] += total
+            entry[2] = max(entry[2], longest)
+
+
+def summary(started_at=None, **extra):
+    """計測値を JSON にそのまま書ける dict にまとめる（キャッシュのヒット率も計算する）"""
+    data = snapshot()
+    caches = {}
+    for name, n in data["counters"].items():
+        if name.startswith("cache.") and name.rsplit(".", 1)[1] in ("hit", "miss"):
+            kind, result = name[len("cache."):].rsplit(".", 1)
+            caches.setdefault(kind, {"hit": 0, "miss": 0})[result] = n
+    for stats in caches.values():
+        lookups = stats["hit"] + stats["miss"]
+        stats["hit_rate"] = round(stats["hit"] / lookups, 4) if lookups else None
+
+    result = dict(extra)
+    if started_at is not None:
+        result["started_at"] = datetime.fromtimestamp(started_at).isoformat(timespec="seconds")
+        result["elapsed"] = round(time.time() - started_at, 3)
+    result["timers"] = {
+        name: {"count": calls, "total": round(total, 4), "mean": round(total / calls, 6), "max": round(longest, 4)}
+        for name, (calls, total, longest) in sorted(data["timers"].items())
+    }
+    result["counters"] = dict(sorted(data["counters"].items()))
+    result["caches"] = dict(sorted(caches.items()))
+    return result
+
+
+def write_summary(path, started_at=None, **extra):
+    data = summary(started_at, **extra)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return data
+
+
+def log_summary(data, top=10):
+    # 合計時間の長い順に主な項目だけをログに出す
+    for name, stats in sorted(data["timers"].items(), key=lambda item: -item[1]["total"])[:top]:
+        logging.info(f"計測: {name} {stats['total']:.2f}秒 ({stats['count']}回)")
+    for kind, stats in data["caches"].items():
+        if stats["hit_rate"] is None:
+            continue
+        logging.info(f"キャッシュ: {kind} ヒット率 {stats['hit_rate'] * 100:.1f}% ({stats['hit']}/{stats['hit'] + stats['miss']})")
+
+
+@contextmanager
+def profiled(path):
+    """path が指定されていれば、ブロック内を cProfile で計測して path に書き出す"""
+    if not path:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
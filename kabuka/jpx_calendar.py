@@ -0,0 +1,191 @@
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+FIRST_YEAR = 2000
+LAST_YEAR = 2099
+
+# 受渡日が T+2 になった日（これより前の権利付最終日は権利確定日の3営業日前）
+T2_SETTLEMENT_START = date(2019, 7, 16)
+
+# 規則では決まらない祝日（皇室行事・東京五輪の移動）
+SPECIAL_HOLIDAYS = {
+    date(2019, 5, 1): "即位の日",
+    date(2019, 10, 22): "即位礼正殿の儀",
+    date(2020, 7, 23): "海の日",
+    date(2020, 7, 24): "スポーツの日",
+    date(2020, 8, 10): "山の日",
+    date(2021, 7, 22): "海の日",
+    date(2021, 7, 23): "スポーツの日",
+    date(2021, 8, 8): "山の日",
+}
+
+# 東証が祝日以外で終日売買を止めた日
+EXCHANGE_CLOSURES = {
+    date(2020, 10, 1): "システム障害",
+}
+
+# 五輪の年は移動したので規則による日付は使わない
+MOVED_HOLIDAYS = {2020: {"海の日", "スポーツの日", "山の日"}, 2021: {"海の日", "スポーツの日", "山の日"}}
+
+
+def _nth_monday(year, month, n):
+    first = date(year, month, 1)
+    return first + timedelta(days=(7 - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def _equinox_day(year, base):
+    return int(base + 0.242194 * (year - 1980) - (year - 1980) // 4)
+
+
+def _rule_holidays(year):
+    holidays = {
+        date(year, 1, 1): "元日",
+        _nth_monday(year, 1, 2): "成人の日",
+        date(year, 2, 11): "建国記念の日",
+        date(year, 3, _equinox_day(year, 20.8431)): "春分の日",
+        date(year, 4, 29): "昭和の日" if year >= 2007 else "みどりの日",
+        date(year, 5, 3): "憲法記念日",
+        date(year, 5, 5): "こどもの日",
+        date(year, 9, _equinox_day(year, 23.2488)): "秋分の日",
+        date(year, 11, 3): "文化の日",
+        date(year, 11, 23): "勤労感謝の日",
+    }
+    if year >= 2007:
+        holidays[date(year, 5, 4)] = "みどりの日"
+    if year <= 2018:
+        holidays[date(year, 12, 23)] = "天皇誕生日"
+    elif year >= 2020:
+        holidays[date(year, 2, 23)] = "天皇誕生日"
+
+    holidays[_nth_monday(year, 9, 3) if year >= 2003 else date(year, 9, 15)] = "敬老の日"
+    moved = MOVED_HOLIDAYS.get(year, set())
+    if "海の日" not in moved:
+        holidays[_nth_monday(year, 7, 3) if year >= 2003 else date(year, 7, 20)] = "海の日"
+    if "山の日" not in moved and year >= 2016:
+        holidays[date(year, 8, 11)] = "山の日"
+    if "スポーツの日" not in moved:
+        holidays[_nth_monday(year, 10, 2)] = "スポーツの日" if year >= 2020 else "体育の日"
+    return holidays
+
+
+def japanese_holidays(year):
+    """year の国民の祝日・振替休日・国民の休日を {date: 名前} で返す"""
+    if not FIRST_YEAR <= year <= LAST_YEAR:
+        raise ValueError(f"対応していない年です: {year}")
+    holidays = _rule_holidays(year)
+    holidays.update((day, name) for day, name in SPECIAL_HOLIDAYS.items() if day.year == year)
+
+    # 振替休日: 日曜の祝日の後の最初の平日（2006年までは翌月曜のみ）
+    for day in sorted(holidays):
+        if day.weekday() != 6:
+            continue
+        substitute = day + timedelta(days=1)
+        while year >= 2007 and substitute in holidays:
+            substitute += timedelta(days=1)
+        if substitute not in holidays:
+            holidays[substitute] = "振替休日"
+
+    # 国民の休日: 祝日に挟まれた平日
+    for day in sorted(holidays):
+        between = day + timedelta(days=1)
+        if between not in holidays and between + timedelta(days=1) in holidays and between.weekday() != 6:
+            holidays[between] = "国民の休日"
+    return holidays
+
+
+def jpx_holidays(year):
+    # 祝日に加えて年末年始（12/31〜1/3）も休場
+    holidays = japanese_holidays(year)
+    for day in (date(year, 1, 2), date(year, 1, 3), date(year, 12, 31)):
+        holidays.setdefault(day, "年末年始休業日")
+    holidays.update((day, name) for day, name in EXCHANGE_CLOSURES.items() if day.year == year)
+    return holidays
+
+
+class TradingCalendar:
+    """東証の営業日を配列で持ち、月初 N 営業日・権利付最終日までの N 営業日を添字で引く
+
+    月ごとの最初と最後の営業日の位置は作成時に計算しておくので、ウィンドウは
+    (開始位置, 終了位置) の組として O(1) で求まる。終了位置は含まない。
+    """
+
+    def __init__(self, first_year=FIRST_YEAR, last_year=None):
+        last_year = last_year or date.today().year + 1
+        self.first_year = first_year
+        self.last_year = last_year
+
+        holidays = set()
+        for year in range(first_year, last_year + 1):
+            holidays.update(jpx_holidays(year))
+        days = np.arange(f"{first_year}-01-01", f"{last_year + 1}-01-01", dtype="datetime64[D]")
+        weekdays = (days.astype("int64") + 3) % 7  # 1970-01-01 は木曜
+        closed = np.isin(days, np.array(sorted(holidays), dtype="datetime64[D]"))
+        self.days = days[(weekdays < 5) & ~closed]
+
+        months = np.arange(f"{first_year}-01", f"{last_year + 1}-02", dtype="datetime64[M]")
+        bounds = np.searchsorted(self.days, months.astype("datetime64[D]"))
+        self.month_start = bounds[:-1]
+        self.month_end = bounds[1:]
+
+    def covers(self, year):
+        return self.first_year <= year <= self.last_year
+
+    def _month_index(self, year, month):
+        if not self.covers(year):
+            raise ValueError(f"カレンダーの範囲外です: {year}")
+        return (year - self.first_year) * 12 + month - 1
+
+    def is_trading_day(self, day):
+        day = np.datetime64(day, "D")
+        i = np.searchsorted(self.days, day)
+        return i < len(self.days) and self.days[i] == day
+
+    def first_days(self, year, month, n):
+        # 月初から n 営業日
+        index = self._month_index(year, month)
+        start = self.month_start[index]
+        return start, min(start + n, self.month_end[index])
+
+    def last_cum_rights_position(self, year, month):
+        # 月末が権利確定日のときの権利付最終日
+        last = self.month_end[self._month_index(year, month)] - 1
+        offset = 2 if self.days[last] >= np.datetime64(T2_SETTLEMENT_START) else 3
+        return last - offset
+
+    def days_until_rights(self, year, month, n):
+        # 権利付最終日までの n 営業日（権利付最終日を含む）
+        end = self.last_cum_rights_position(year, month) + 1
+        return max(end - n, 0), end
+
+    def window_dates(self, start, end):
+        # 位置の組を history() と同じ [start, end) の日付文字列にする
+        end_date = self.days[end] if end < len(self.days) else self.days[-1] + 1
+        return str(self.days[start]), str(end_date)
+
+    def align(self, closes):
+        """日足の Series を営業日の配列に並べ直す（足のない日は NaN）"""
+        values = np.full(len(self.days), np.nan)
+        if closes is None or closes.empty:
+            return values
+        dates = closes.index.values.astype("datetime64[D]")
+        positions = np.searchsorted(self.days, dates)
+        found = (positions < len(self.days)) & (self.days[np.minimum(positions, len(self.days) - 1)] == dates)
+        values[positions[found]] = closes.to_numpy(dtype="float64")[found]
+        return values
+
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+
+def get_calendar(*years):
+    # 必要な年が範囲外のときだけ作り直す
+    global _calendar
+    with _calendar_lock:
+        if _calendar is None or not all(_calendar.covers(year) for year in years):
+            first_year = min([FIRST_YEAR, *years])
+            last_year = max([date.today().year + 1, *years])
+            _calendar = TradingCalendar(first_year, last_year)
+        return _calendar
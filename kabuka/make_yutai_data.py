@@ -1,84 +1,127 @@
-import requests
-from bs4 import BeautifulSoup
+import json
+import os
 import re
+import shutil
 import time
-import pickle
 from pathlib import Path
 
-CACHE_FILE = "yutai_all_cache.pkl"
+import screener
+from cache_store import TTL, Cache
+from fetch_pool import TokenBucket, call_with_retry, run_concurrently
+from http_client import fetch_cached
+from minkabu_parser import SEARCH_PARSER_VERSION, parse_search_page
 
+CACHE_FILE = Path(__file__).resolve().parent / "yutai_all_cache.pkl"
+# 取得途中のページ（中断したら続きから取得する）。カレントディレクトリによらず kabuka/ の下に置く
+CRAWL_DIR = Path(__file__).resolve().parent / "yutai_crawl"
 
-def save_cache(data):
-    with open(CACHE_FILE, "wb") as f:
-        pickle.dump(data, f)
+BASE_URL = "https://minkabu.jp/yutai/search"
+FIRST_PAGE = 2  # ページ1は無効なデータの可能性があるためスキップ
+CRAWL_WORKERS = 4
+CRAWL_RATE = 1  # 1秒あたりのリクエスト数
 
 
-def load_cache():
-    if Path(CACHE_FILE).exists():
-        with open(CACHE_FILE, "rb") as f:
-            return pickle.load(f)
-    return None
+def discover_page_count(html):
+    # ページャーのリンク（?page=N）から最終ページ番号を求める
+    pages = [int(p) for p in re.findall(r"[?&](?:amp;)?page=(\d+)", html)]
+    return max(pages) if pages else None
 
 
-def fetch_all_yutai_data():
-    headers = {"User-Agent": "Mozilla/5.0"}
-    base_url = "https://minkabu.jp/yutai/search"
-    page = 2  # ページ1は無効なデータの可能性があるためスキップ
-    result = {}
+def parse_search_result(html):
+    # 各銘柄は検索結果に載っている項目をすべて持つ（code, name, rate, months, summary, dividend, investment）
+    return {"items": parse_search_page(html), "page_count": discover_page_count(html)}
+
+
+def fetch_search_page(page):
+    # 前回から変わっていなければ 304 になり、保存済みの本文・解析結果を使う
+    res = fetch_cached(f"{BASE_URL}?page={page}")
+    if res.status_code != 200:
+        raise RuntimeError(f"ページ {page} の取得失敗: {res.status_code}")
+    return res
+
+
+def checkpoint_path(page):
+    return Path(CRAWL_DIR) / f"page_{page:04d}.json"
+
+
+def discard_stale_checkpoints():
+    # 優待銘柄一覧の有効期間より前に保存したページは、続きに使わず取り直す
+    deadline = time.time() - TTL["yutai_universe"]
+    for path in Path(CRAWL_DIR).glob("page_*.json"):
+        if path.stat().st_mtime < deadline:
+            path.unlink()
+
+
+def load_checkpoint(page):
+    path = checkpoint_path(page)
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(name, data):
+    # 途中で落ちても壊れたファイルが残らないよう一時ファイル経由で置き換える
+    path = Path(CRAWL_DIR) / name
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
 
-    while True:
-        print(f"ページ {page} を取得中...")
-        res = requests.get(f"{base_url}?page={page}", headers=headers)
-        if res.status_code != 200:
-            print(f"ページ {page} の取得失敗: {res.status_code}")
-            break
 
-        soup = BeautifulSoup(res.text, "html.parser")
-        items = soup.find_all("li", class_="yutai_rank_style")
-        if not items:
-            break
+def crawl_page(page, limiter):
+    checkpoint = load_checkpoint(page)
+    if checkpoint is not None:
+        return checkpoint["items"], checkpoint.get("page_count")
 
-        for item in items:
+    print(f"ページ {page} を取得中...")
+    res = call_with_retry(fetch_search_page, page, limiter=limiter, label=f"ページ {page}")
+    result = res.parse(parse_search_result, key=f"parse_search_result.v{SEARCH_PARSER_VERSION}")
+    items, page_count = result["items"], result["page_count"]
+    save_checkpoint(checkpoint_path(page).name, {"items": items, "page_count": page_count})
+    return items, page_count
+
+
+def fetch_all_yutai_data():
+    """検索結果ページを並列に取得し、ページごとに CRAWL_DIR へ保存する
+
+    中断した場合は保存済みのページを読み込んで続きから取得する（優待銘柄一覧の
+    有効期間より古いページは取り直す）。
+    ページ数が分からない場合は従来どおり空のページまで順に取得する。
+    """
+    os.makedirs(CRAWL_DIR, exist_ok=True)
+    discard_stale_checkpoints()
+    limiter = TokenBucket(CRAWL_RATE, 1)
+
+    pages = {}
+    items, page_count = crawl_page(FIRST_PAGE, limiter)
+    pages[FIRST_PAGE] = items
+
+    if page_count:
+        targets = list(range(FIRST_PAGE + 1, page_count + 1))
+        results = run_concurrently(lambda page: crawl_page(page, limiter), targets, CRAWL_WORKERS)
+        failed = []
+        for page, crawled in zip(targets, results):
+            if crawled is None:
+                failed.append(page)
+            else:
+                pages[page] = crawled[0]
+        if failed:
+            raise RuntimeError(f"{len(failed)} ページの取得に失敗しました。再実行すると続きから取得します")
+    else:
+        page = FIRST_PAGE
+        while items:
+            page += 1
             try:
-                link_tag = item.find("a", href=re.compile("^/stock/\\d+/yutai"))
-                if not link_tag:
-                    continue
-                code_match = re.search(r"/stock/(\d+)/yutai", link_tag["href"])
-                if not code_match:
-                    continue
-                code = code_match.group(1)
-
-                name_tag = item.select_one("a.fwb")
-                name = name_tag.text.strip().split("(")[0] if name_tag else "-"
-
-                rate = 0.0
-                rate_divs = item.find_all("div", class_="mr8")
-                for div in rate_divs:
-                    if "株主優待利回り" in div.text:
-                        rate_span = div.find("span", class_="fsn fwb fcrd")
-                        if rate_span and rate_span.text.strip() != "---":
-                            try:
-                                rate = float(rate_span.text.strip())
-                            except ValueError:
-                                rate = 0.0
-                        break
-
-                month_box = item.find("span", class_="md_ico_tx", string="権利確定月")
-                month_text = month_box.find_next("span", class_="fsm fwb").text.strip() if month_box else ""
-                months = [m.strip() for m in month_text.split(",") if m.strip()]
-
-                result[code] = {
-                    "code": code,
-                    "name": name,
-                    "rate": rate,
-                    "months": months
-                }
+                items, _ = crawl_page(page, limiter)
             except Exception as e:
-                print(f"スキップ: {e}")
-                continue
+                print(e)
+                break
+            pages[page] = items
 
-        page += 1
-        time.sleep(1)
+    result = {}
+    for page in sorted(pages):
+        result.update(pages[page])
 
     # 無効なデータを除去（特にページ1のゴミデータ対策）
     cleaned_result = {
@@ -86,40 +129,47 @@ def fetch_all_yutai_data():
         if val["rate"] > 0 or val["months"]
     }
 
+    shutil.rmtree(CRAWL_DIR, ignore_errors=True)
     print(f"{len(cleaned_result)} 件の有効なデータを取得しました。")
     return cleaned_result
 
 
-def main():
-    try:
-        month = input("優待権利確定月を入力してください（例：4）: ")
-        top_n = int(input("上位何件を抽出しますか？（例：50）: "))
-        filename = f"{int(month):02d}yutai.txt"
+def load_universe(refresh=False):
+    print("キャッシュを確認中...")
+    cache = Cache(CACHE_FILE, "yutai_universe")
+
+    # 検索結果は全ページまとめて取り直すので、1件でも期限切れなら全体を更新する
+    if refresh or not len(cache) or cache.stale_keys(cache.keys()):
+        print("キャッシュが見つからないか古くなっています。全銘柄を取得します...")
+        universe = fetch_all_yutai_data()
+        for code in set(cache.keys()) - set(universe):
+            cache.discard(code)
+        cache.update(universe)
+        cache.save()
+    return cache.as_dict()
 
-        print("キャッシュを確認中...")
-        cache = load_cache()
 
-        if not cache:
-            print("キャッシュが見つかりません。全銘柄を取得します...")
-            cache = fetch_all_yutai_data()
-            save_cache(cache)
+def load_cached_universe():
+    # 取り直さずに保存済みの一覧だけを返す（期限切れでも使う。なければ空）
+    return Cache(CACHE_FILE, "yutai_universe").as_dict()
 
-        filtered = [(code, info["rate"]) for code, info in cache.items() if month + "月" in info["months"]]
-        filtered.sort(key=lambda x: x[1], reverse=True)
 
-        if not filtered:
-            print(f"{month}月の優待銘柄が見つかりませんでした。")
-            return
+def main():
+    try:
+        year = int(input("株価の比較に使う最終年を入力してください（例：2024）: "))
+        top_n = int(input("上位何件を抽出しますか？（例：50）: "))
 
-        with open(filename, "w", encoding="utf-8") as f:
-            for code, rate in filtered[:top_n]:
-                f.write(code + "\n")
+        universe = load_universe()
+        selections = screener.run(universe, year, top_n)
 
-        print(f"{filename} を作成しました（優待利回り順）")
+        for month, codes in selections.items():
+            if not codes:
+                print(f"{month}月の優待銘柄が見つかりませんでした。")
+        print("01yutai.txt 〜 12yutai.txt を作成しました（優待利回り・配当利回り・株価の値動きのスコア順）")
 
     except Exception as e:
         print(f"エラー: {e}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import os
+import sqlite3
+from collections.abc import Mapping
+from pathlib import Path
+
+import instrument
+
+XLS_FILE = Path(__file__).resolve().parent / "data_j.xls"
+INDEX_FILE = Path(__file__).resolve().parent / "data_j.db"
+
+# data_j.xls（JPX 上場銘柄一覧）の列名 → テーブルの列名
+COLUMNS = {
+    "コード": "code",
+    "銘柄名": "name",
+    "市場・商品区分": "market",
+    "33業種コード": "industry33_code",
+    "33業種区分": "industry33",
+    "17業種コード": "industry17_code",
+    "17業種区分": "industry17",
+    "規模コード": "scale_code",
+    "規模区分": "scale",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stocks (
+    code TEXT PRIMARY KEY,
+    name TEXT,
+    market TEXT,
+    industry33_code TEXT,
+    industry33 TEXT,
+    industry17_code TEXT,
+    industry17 TEXT,
+    scale_code TEXT,
+    scale TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS source (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_source(conn):
+    try:
+        return dict(conn.execute("SELECT key, value FROM source").fetchall())
+    except sqlite3.Error:
+        return {}
+
+
+@instrument.timed("xls.load")
+def build_index(xls_path=XLS_FILE, index_path=INDEX_FILE, xls_hash=None):
+    import pandas as pd
+
+    df = pd.read_excel(xls_path, engine="xlrd", dtype=str)
+    df = df[[c for c in COLUMNS if c in df.columns]].rename(columns=COLUMNS)
+    df = df.dropna(subset=["code", "name"])
+
+    tmp_path = f"{index_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.executescript(SCHEMA)
+    columns = list(df.columns)
+    conn.executemany(
+        f"INSERT OR REPLACE INTO stocks ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+        df.itertuples(index=False, name=None),
+    )
+    conn.executemany(
+        "INSERT INTO source (key, value) VALUES (?, ?)",
+        [
+            ("mtime_ns", str(os.stat(xls_path).st_mtime_ns)),
+            ("sha1", xls_hash or _file_hash(xls_path)),
+        ],
+    )
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, index_path)
+    logging.info(f"銘柄インデックスを作成しました: {index_path} ({len(df)} 件)")
+
+
+def ensure_index(xls_path=XLS_FILE, index_path=INDEX_FILE):
+    """XLS の mtime が変わったときだけハッシュを確認し、内容が変わっていれば作り直す"""
+    if not Path(xls_path).exists():
+        return index_path
+
+    mtime_ns = str(os.stat(xls_path).st_mtime_ns)
+    source = {}
+    if Path(index_path).exists():
+        conn = sqlite3.connect(index_path)
+        source = _read_source(conn)
+        conn.close()
+
+    if source.get("mtime_ns") == mtime_ns:
+        return index_path
+
+    xls_hash = _file_hash(xls_path)
+    if source.get("sha1") == xls_hash:
+        conn = sqlite3.connect(index_path)
+        with conn:
+            conn.execute("UPDATE source SET value = ? WHERE key = 'mtime_ns'", (mtime_ns,))
+        conn.close()
+        return index_path
+
+    build_index(xls_path, index_path, xls_hash)
+    return index_path
+
+
+class StockIndex(Mapping):
+    """code → 銘柄名 の読み取り専用マッピング（初回参照時に索引を開く）
+
+    name_dict として dict の代わりに渡せるほか、get_info() で市場区分や
+    業種コードなどのマスタ情報も引ける。
+    """
+
+    def __init__(self, xls_path=XLS_FILE, index_path=INDEX_FILE):
+        self.xls_path = xls_path
+        self.index_path = index_path
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            ensure_index(self.xls_path, self.index_path)
+            self._conn = sqlite3.connect(self.index_path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+        return self._conn
+
+    def __getitem__(self, code):
+        row = self.conn.execute("SELECT name FROM stocks WHERE code = ?", (code,)).fetchone()
+        if row is None:
+            raise KeyError(code)
+        return row["name"]
+
+    def __iter__(self):
+        return (row[0] for row in self.conn.execute("SELECT code FROM stocks ORDER BY code"))
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM stocks").fetchone()[0]
+
+    def get_info(self, code):
+        row = self.conn.execute("SELECT * FROM stocks WHERE code = ?", (code,)).fetchone()
+        return dict(row) if row else None
+
+    def codes_by(self, **filters):
+        # 例: codes_by(market="プライム（内国株式）", industry33_code="50")
+        unknown = set(filters) - set(COLUMNS.values())
+        if unknown:
+            raise ValueError(f"不明な列: {', '.join(sorted(unknown))}")
+        where = " AND ".join(f"{column} = ?" for column in filters) or "1"
+        rows = self.conn.execute(f"SELECT code FROM stocks WHERE {where} ORDER BY code", tuple(filters.values()))
+        return [row[0] for row in rows]
@@ -0,0 +1,143 @@
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+import instrument
+
+try:
+    import lxml  # noqa: F401
+    PARSER_BACKEND = "lxml"
+except ImportError:
+    PARSER_BACKEND = "html.parser"
+
+# 検索結果ページは各銘柄の li だけ、個別ページは見出しと表の行だけを解析する
+SEARCH_ITEMS = SoupStrainer("li", class_="yutai_rank_style")
+DETAIL_FIELDS = SoupStrainer(["h3", "tr"])
+
+STOCK_LINK = re.compile(r"^/stock/(\d+)/yutai")
+
+DETAIL_LABELS = ["最低投資金額", "優待発生株数", "優待権利確定月"]
+
+# 優待情報の項目（個別ページから取る項目。表示もこの順）
+YUTAI_FIELDS = ["優待内容", "優待利回り", "配当利回り", "最低投資金額", "優待発生株数", "優待権利確定月", "権利確定日"]
+
+# 検索結果から取る項目を変えたら上げる（http_cache に保存済みの解析結果を使わなくなる）
+SEARCH_PARSER_VERSION = 3
+
+
+def parse_float(text):
+    text = text.strip()
+    if not text or text == "---":
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def make_soup(html, parse_only=None, backend=None):
+    return BeautifulSoup(html, backend or PARSER_BACKEND, parse_only=parse_only)
+
+
+def find_search_items(html, backend=None):
+    soup = make_soup(html, SEARCH_ITEMS, backend)
+    return soup.find_all("li", class_="yutai_rank_style")
+
+
+def parse_item_code(item):
+    link_tag = item.find("a", href=STOCK_LINK)
+    if not link_tag or not link_tag.get("href"):
+        return None
+    return STOCK_LINK.match(link_tag["href"]).group(1)
+
+
+def parse_search_item(item):
+    code = parse_item_code(item)
+    if not code:
+        return None
+
+    name_tag = item.select_one("a.fwb")
+    name = name_tag.text.strip().split("(")[0] if name_tag else "-"
+
+    rate = 0.0
+    rate_divs = item.find_all("div", class_="mr8")
+    for div in rate_divs:
+        if "株主優待利回り" in div.text:
+            rate_span = div.find("span", class_="fsn fwb fcrd")
+            if rate_span:
+                rate = parse_float(rate_span.text) or 0.0
+            break
+
+    # 配当利回り（検索結果に載っていれば）
+    dividend = None
+    for div in rate_divs:
+        if "配当利回り" in div.text and "株主優待利回り" not in div.text:
+            value_span = div.find("span", class_="fsn")
+            dividend = parse_float(value_span.text) if value_span else None
+            break
+
+    month_box = item.find("span", class_="md_ico_tx", string="権利確定月")
+    month_text = month_box.find_next("span", class_="fsm fwb").text.strip() if month_box else ""
+    months = [m.strip() for m in month_text.split(",") if m.strip()]
+
+    summary_tag = item.find("div", class_="yutai_item")
+    summary = summary_tag.text.strip() if summary_tag else None
+
+    # 最低投資金額（万円）。権利確定月の "fsm fwb" と区別するため class が fsm だけのものを見る
+    investment_tag = item.select_one('span[class="fsm"]')
+    investment = investment_tag.text.strip() + "万" if investment_tag and investment_tag.text.strip() else None
+
+    return {
+        "code": code,
+        "name": name,
+        "rate": rate,
+        "months": months,
+        "summary": summary,
+        "dividend": dividend,
+        "investment": investment,
+    }
+
+
+@instrument.timed("parse.search_page")
+def parse_search_page(html, backend=None):
+    result = {}
+    for item in find_search_items(html, backend):
+        try:
+            info = parse_search_item(item)
+        except Exception as e:
+            print(f"スキップ: {e}")
+            continue
+        if info:
+            result[info["code"]] = info
+    return result
+
+
+@instrument.timed("parse.detail_page")
+def parse_yutai_detail(html, backend=None):
+    soup = make_soup(html, DETAIL_FIELDS, backend)
+
+    result = dict.fromkeys(YUTAI_FIELDS, "-")
+
+    # 優待内容
+    summary_tag = soup.find("h3", id="yutai_summary")
+    if summary_tag:
+        result["優待内容"] = summary_tag.text.strip()
+
+    # 優待利回り・配当利回り
+    for key, cell_id in (("優待利回り", "yutai_valuations_yutai"), ("配当利回り", "yutai_valuations_haito")):
+        cell = soup.find("td", id=cell_id)
+        if cell:
+            result[key] = cell.text.strip()
+
+    # 最低投資金額・優待発生株数・優待権利確定月
+    for label in DETAIL_LABELS:
+        th = soup.find("th", string=label)
+        if th and th.find_next_sibling("td"):
+            result[label] = th.find_next_sibling("td").text.strip()
+
+    # 権利確定日（複数ある場合は最後のもの）
+    date = soup.find_all("th", string="権利確定日")
+    if date and date[-1].find_next_sibling("td"):
+        result["権利確定日"] = date[-1].find_next_sibling("td").text.strip()
+
+    return result
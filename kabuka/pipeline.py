@@ -0,0 +1,237 @@
+import argparse
+import importlib.util
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import getyfinance
+import incremental
+import instrument
+import make_yutai_data
+import master_index
+import report_data
+import screener
+from price_store import PriceStore, import_legacy_cache
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# 実行ごとの計測結果（段階ごとの時間・リクエスト数・キャッシュのヒット率）
+METRICS_FILE = "run_metrics.json"
+
+
+def _load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+add_yutai_info = _load_module("add_yutai_info", BASE_DIR / "2024" / "add_yutai_info.py")
+
+INDEX_HEADER = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+  <meta charset="UTF-8">
+  <title>月別 株価リンク集</title>
+  <style>
+    body {
+      font-family: sans-serif;
+      text-align: center;
+      margin: 2em;
+      background-color: #f9f9f9;
+    }
+    h1 {
+      font-size: 24px;
+      margin-bottom: 1em;
+    }
+    ul {
+      list-style: none;
+      padding: 0;
+    }
+    li {
+      margin: 0.5em 0;
+    }
+    a {
+      text-decoration: none;
+      color: #0066cc;
+      font-weight: bold;
+    }
+    a:hover {
+      text-decoration: underline;
+    }
+    a.static {
+      font-size: 12px;
+      font-weight: normal;
+      color: #888;
+    }
+  </style>
+</head>
+<body>
+"""
+
+INDEX_FOOTER = """</body>
+</html>
+"""
+
+
+def prepare_code_lists(year, months, top_n, select):
+    if select:
+        # 12ヶ月分の NNyutai.txt をまとめて作り直す
+        screener.run(make_yutai_data.load_universe(), year, top_n)
+
+    code_lists = {}
+    for month in months:
+        codes = getyfinance.load_codes(screener.code_list_file(month))
+        code_lists[month] = codes
+        logging.info(f"{month:02d}月: {len(codes)} 銘柄")
+    return code_lists
+
+
+def prefetch_prices(code_lists, year):
+    # 全月の銘柄・期間をまとめて一度に取得し、各月のプロセスはストアを読むだけにする
+    codes = sorted({code for codes in code_lists.values() for code in codes})
+    ranges = [getyfinance.get_history_range(year, month) for month in code_lists]
+    store = PriceStore(getyfinance.CONFIG['PRICE_DB_FILE'])
+    import_legacy_cache(store, getyfinance.CONFIG['YF_CACHE_FILE'])
+    getyfinance.load_price_histories(store, codes, min(r[0] for r in ranges), max(r[1] for r in ranges))
+    store.close()
+
+
+def prefetch_yutai(code_lists):
+    # 個別ページで取れなかった項目は、保存済みの検索結果（取り直さない）の値で補う
+    universe = make_yutai_data.load_cached_universe()
+    cache = add_yutai_info.open_yutai_cache()
+    codes = sorted({code for codes in code_lists.values() for code in codes})
+    add_yutai_info.fetch_missing_yutai_info(codes, cache)
+    cache.save()
+    return {code: add_yutai_info.merge_yutai_info(code, cache, universe) for code in codes}
+
+
+def build_month(year, month, codes, yutai_data, force=False, profile_dir=None):
+    # 計測値はプロセスごとに集め、呼び出し側でまとめる
+    instrument.reset()
+    profile_path = os.path.join(profile_dir, f"build_{year}_{month:02d}.prof") if profile_dir else None
+    with instrument.profiled(profile_path), instrument.timer("stage.build_month"):
+        name_dict = getyfinance.load_name_dict_from_excel()
+        # 株価は親プロセスが prefetch_prices で取得済み。各プロセスは読むだけで、SQLite に書くのは親だけにする
+        store = PriceStore(getyfinance.CONFIG['PRICE_DB_FILE'], read_only=True)
+        # 優待情報ありなら最終版を直接書き出す（中間の NN_output.html は作らない）
+        suffix = "final" if yutai_data is not None else "output"
+        output_file = f"{year}/{month:02d}_{suffix}.html"
+        rebuilt = incremental.generate_report(
+            codes, year, month, name_dict, store, output_file, yutai_data=yutai_data, force=force, fetch=False,
+        )
+        store.close()
+    return output_file, rebuilt, instrument.snapshot()
+
+
+def write_index_html(path="index.html"):
+    # 既存の YYYY/NN_final.html を年ごとにまとめてリンク集を作り直す
+    reports = {}
+    for report in sorted(Path(".").glob("[0-9][0-9][0-9][0-9]/[0-9][0-9]_final.html")):
+        reports.setdefault(report.parent.name, []).append(int(report.name[:2]))
+
+    parts = [INDEX_HEADER]
+    for year, months in sorted(reports.items(), reverse=True):
+        parts.append(f"  <h1>{year}年 株価月別レポート</h1>\n  <ul>\n")
+        for month in months:
+            if report_data.index_path(year, month).exists():
+                # データがある月はビューアを開き、静的な HTML は補助のリンクにする
+                parts.append(
+                    f'    <li><a href="viewer.html#{year}-{month:02d}">{month}月レポート</a>'
+                    f' <a class="static" href="{year}/{month:02d}_final.html">HTML</a></li>\n'
+                )
+            else:
+                parts.append(f'    <li><a href="{year}/{month:02d}_final.html">{month}月レポート</a></li>\n')
+        parts.append("  </ul>\n")
+    parts.append(INDEX_FOOTER)
+
+    incremental.write_if_changed(path, "".join(parts))
+    return path
+
+
+def run(year, months, top_n=50, select=False, with_yutai=True, workers=None, force=False,
+        metrics_file=METRICS_FILE, profile_dir=None):
+    started_at = time.time()
+    instrument.reset()
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+    with instrument.profiled(profile_dir and os.path.join(profile_dir, "main.prof")):
+        with instrument.timer("stage.code_lists"):
+            code_lists = prepare_code_lists(year, months, top_n, select)
+        with instrument.timer("stage.prefetch_prices"):
+            prefetch_prices(code_lists, year)
+        with instrument.timer("stage.prefetch_yutai"):
+            yutai_data = prefetch_yutai(code_lists) if with_yutai else None
+
+        # 名前索引は先に作っておき、各プロセスは読み込むだけにする
+        with instrument.timer("stage.name_index"):
+            name_dict = getyfinance.load_name_dict_from_excel()
+            master_index.ensure_index(name_dict.xls_path, name_dict.index_path)
+
+        with instrument.timer("stage.build"), ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(build_month, year, month, code_lists[month], yutai_data, force, profile_dir)
+                for month in months
+            ]
+            for future in futures:
+                final_file, rebuilt, metrics = future.result()
+                instrument.merge(metrics)
+                instrument.count("months.rebuilt" if rebuilt else "months.skipped")
+                logging.info(f"{'作成' if rebuilt else 'スキップ'}: {final_file}")
+
+        with instrument.timer("stage.index"):
+            index_file = write_index_html()
+
+    if metrics_file:
+        summary = instrument.write_summary(metrics_file, started_at, year=year, months=months)
+        instrument.log_summary(summary)
+    print(f"処理が完了しました。{index_file} を確認してください。")
+
+
+def parse_months(text):
+    months = []
+    for part in text.split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            months.extend(range(int(start), int(end) + 1))
+        else:
+            months.append(int(part))
+    return sorted(set(months))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="銘柄リスト → 株価 → レポート → 優待情報 を一括で作成する")
+    parser.add_argument("--year", type=int, required=True, help="対象年 (例: 2024)")
+    parser.add_argument("--months", type=parse_months, default=list(range(1, 13)), help="対象月 (例: 1-12, 3,9)")
+    parser.add_argument("--select-codes", action="store_true", help="NNyutai.txt を優待利回り・配当利回り・値動きのスコア順に作り直す")
+    parser.add_argument("--top-n", type=int, default=50, help="--select-codes 時の抽出件数")
+    parser.add_argument("--no-yutai", action="store_true", help="優待情報の追加を行わない")
+    parser.add_argument("--workers", type=int, default=None, help="月ごとの並列プロセス数")
+    parser.add_argument("--force", action="store_true", help="変更の有無に関わらず全月を作り直す")
+    parser.add_argument("--trading-days", action="store_true", help="平均を取る期間を暦日ではなく東証の営業日で数える（数値が変わる）")
+    parser.add_argument("--price-fixtures", default=None, help="株価をネットワークではなく {code}.csv のディレクトリから読む")
+    parser.add_argument("--metrics", default=METRICS_FILE, help="計測結果の JSON の出力先（空文字で出力しない）")
+    parser.add_argument("--profile", default=None, metavar="DIR", help="cProfile の結果をプロセスごとに DIR/*.prof へ書き出す")
+    args = parser.parse_args()
+
+    if args.trading_days:
+        getyfinance.CONFIG['WINDOW_MODE'] = 'trading'
+    if args.price_fixtures:
+        getyfinance.CONFIG['PRICE_FIXTURE_DIR'] = os.path.abspath(args.price_fixtures)
+    if args.metrics:
+        args.metrics = os.path.abspath(args.metrics)
+    if args.profile:
+        args.profile = os.path.abspath(args.profile)
+
+    # 各スクリプトは kabuka/ をカレントディレクトリとして相対パスでファイルを扱う
+    os.chdir(BASE_DIR)
+    run(args.year, args.months, args.top_n, args.select_codes, not args.no_yutai, args.workers, args.force,
+        args.metrics, args.profile)
+
+
+if __name__ == "__main__":
+    main()
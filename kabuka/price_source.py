@@ -0,0 +1,158 @@
+import logging
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+import instrument
+from fetch_pool import call_with_retry, run_concurrently
+
+# yf.download() はモジュール内の共有状態を使うため同時に1本しか走らせない
+_download_lock = threading.Lock()
+
+
+def _normalize_closes(closes):
+    closes = closes.dropna()
+    if closes.index.tz is not None:
+        closes.index = closes.index.tz_localize(None)
+    return closes.astype(float)
+
+
+def _no_bars():
+    # 取得元が「期間内に足がない」と答えた銘柄の値
+    return pd.Series(dtype=float)
+
+
+class YFinanceSource:
+    """yfinance の一括ダウンロードで複数銘柄の終値をまとめて取得する
+
+    期間内に足がないことを確かめられるのは1銘柄の Ticker.history() だけなので、
+    その場合だけ空の Series を返す。yf.download() は銘柄ごとの失敗を例外にせず
+    ログに出すだけなので、列がない・すべて NaN の銘柄は結果に含めない
+    （fetch_closes が取得失敗として1銘柄ずつ取り直す）。
+    """
+
+    def __init__(self):
+        import yfinance as yf
+
+        # history() の取得失敗を空の DataFrame ではなく例外で受け取り、足がない場合と区別する
+        yf.config.debug.hide_exceptions = False
+
+    def download_closes(self, codes, start_date, end_date):
+        import yfinance as yf
+        from yfinance.exceptions import YFPricesMissingError
+
+        instrument.count("yfinance.requests")
+        tickers = [f"{code}.T" for code in codes]
+        if len(tickers) == 1:
+            # 1銘柄なら Ticker.history() を使い、ロックなしで並列に取得できるようにする。
+            # YFPricesMissingError は Yahoo が期間内の足がないと答えた場合（通信の失敗などは別の例外）
+            try:
+                df = yf.Ticker(tickers[0]).history(start=start_date, end=end_date)
+            except YFPricesMissingError:
+                return {codes[0]: _no_bars()}
+            if df.empty:
+                return {codes[0]: _no_bars()}
+            return {codes[0]: _normalize_closes(df["Close"])}
+
+        with _download_lock:
+            df = yf.download(
+                tickers,
+                start=start_date,
+                end=end_date,
+                auto_adjust=True,
+                group_by="column",
+                progress=False,
+                threads=True,
+            )
+        if df.empty:
+            return {}
+
+        closes = df["Close"]
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(tickers[0])
+
+        result = {}
+        for code, ticker in zip(codes, tickers):
+            if ticker not in closes.columns:
+                continue
+            series = _normalize_closes(closes[ticker])
+            if not series.empty:
+                result[code] = series
+        return result
+
+
+class FixtureSource:
+    """オフライン用: fixture_dir/{code}.csv（Date,Close）から終値を返す
+
+    CSV がない銘柄は取得失敗として結果に含めず、期間内に行がない銘柄は空の Series を返す。
+    """
+
+    def __init__(self, fixture_dir):
+        self.fixture_dir = Path(fixture_dir)
+
+    def download_closes(self, codes, start_date, end_date):
+        result = {}
+        for code in codes:
+            path = self.fixture_dir / f"{code}.csv"
+            if not path.exists():
+                continue
+            df = pd.read_csv(path, index_col="Date", parse_dates=True)
+            closes = _normalize_closes(df["Close"])
+            result[code] = closes[(closes.index >= start_date) & (closes.index < end_date)]
+        return result
+
+
+def fetch_closes(codes, start_date, end_date, source, chunk_size=50, retry_count=3, sleep_time=1,
+                 max_workers=1, limiter=None, empty=None):
+    """codes をチャンク単位で一括取得し、{code: 終値Series} を返す（end は含まない）
+
+    チャンクは max_workers 本まで並列に取得し、各リクエストは limiter でレート制限、
+    失敗時は指数バックオフで再試行する。チャンク全体が失敗した場合や、一括取得は
+    成功しても一部の銘柄が返されなかった場合は、その銘柄を1銘柄ずつ取り直し、
+    失敗を銘柄単位に閉じ込める。取得できなかった銘柄は結果に含まれない。
+    取得元が期間内に足がないと答えた銘柄（空の Series）も結果には含めず、
+    empty（set）を渡すとそこに加える。
+    """
+    def download(chunk):
+        closes = source.download_closes(chunk, start_date, end_date)
+        if len(chunk) == 1 and chunk[0] not in closes:
+            # 例外にならずに結果から落ちた銘柄も取得失敗として再試行する
+            raise LookupError(f"{chunk[0]}の株価履歴が返されませんでした")
+        return closes
+
+    def fetch_chunk(chunk):
+        try:
+            result = call_with_retry(
+                download, chunk,
+                retry_count=retry_count, base_delay=sleep_time, limiter=limiter,
+                label=f"{chunk[0]} ほか{len(chunk)}件",
+            )
+        except Exception as e:
+            if len(chunk) == 1:
+                logging.warning(f"警告: {chunk[0]}の株価履歴取得に失敗 - {str(e)}")
+                return {}
+            logging.warning(f"警告: 一括取得に失敗したため個別に取得します - {str(e)}")
+            result = {}
+
+        # 一括取得で返されなかった銘柄は1銘柄ずつ取り直す
+        missing = [code for code in chunk if code not in result]
+        if len(chunk) > 1 and missing:
+            if result:
+                logging.info(f"一括取得で返されなかった{len(missing)}件を個別に取得します: {', '.join(missing)}")
+            for code in missing:
+                result.update(fetch_chunk([code]))
+        return {code: result[code] for code in chunk if code in result}
+
+    chunks = [codes[i:i + chunk_size] for i in range(0, len(codes), chunk_size)]
+    result = {}
+    with instrument.timer("prices.download"):
+        for fetched in run_concurrently(fetch_chunk, chunks, max_workers):
+            for code, closes in (fetched or {}).items():
+                if not closes.empty:
+                    result[code] = closes
+                elif empty is not None:
+                    empty.add(code)
+    instrument.count("prices.requested", len(codes))
+    instrument.count("prices.fetched", len(result))
+    return result
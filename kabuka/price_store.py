@@ -0,0 +1,286 @@
+import json
+import logging
+import sqlite3
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import instrument
+from cache_store import Cache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bars (
+    code TEXT NOT NULL,
+    date TEXT NOT NULL,
+    close REAL NOT NULL,
+    PRIMARY KEY (code, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS coverage (
+    code TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_code ON coverage (code);
+CREATE TABLE IF NOT EXISTS empty_ranges (
+    code TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    checked_on TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS empty_ranges_code ON empty_ranges (code);
+CREATE TABLE IF NOT EXISTS legacy_reports (
+    code TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (code, year, month)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+# 取得元が足がないと答えた期間（上場前・上場廃止・売買停止）を取り直さない日数。
+# 売買の再開や取得元のデータの補完に備えて期限を設ける
+EMPTY_RANGE_DAYS = 7
+
+
+def _empty_range_cutoff():
+    return (date.today() - timedelta(days=EMPTY_RANGE_DAYS)).isoformat()
+
+
+class PriceStore:
+    """(code, date) をキーに日足終値を保持する SQLite ストア
+
+    bars は追記のみで既存の値は上書きしない。coverage には取得済みの期間
+    [start, end) を銘柄ごとに記録し、未取得の期間だけをネットワークから取る。
+    取得元が足が1本もないと答えた期間は empty_ranges に記録し、
+    EMPTY_RANGE_DAYS の間は取得済みとして扱う。
+
+    終値は分割・配当で調整した値なので、分割や配当があると取得元の過去の値が
+    変わる。追記のたびに保存済みの足と重なる日の値を比べ、変わっていれば
+    その銘柄を捨てて取り直す（extend_to_stored_bar・append_closes）。
+    """
+
+    def __init__(self, path, check_same_thread=True, read_only=False):
+        self.path = path
+        if read_only:
+            # 読むだけのプロセス（pipeline の月ごとの処理）。書き込みは SQLite が拒否する
+            self.conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True,
+                                        check_same_thread=check_same_thread)
+            return
+        # 複数スレッドから使う場合（report_server）は呼び出し側でロックする
+        self.conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def covered_ranges(self, code):
+        rows = self.conn.execute(
+            "SELECT start_date, end_date FROM coverage WHERE code = ?", (code,)
+        ).fetchall()
+        return _merge_ranges(rows)
+
+    def empty_ranges(self, code):
+        return self.conn.execute(
+            "SELECT start_date, end_date FROM empty_ranges WHERE code = ? AND checked_on > ?",
+            (code, _empty_range_cutoff()),
+        ).fetchall()
+
+    def missing_ranges(self, code, start_date, end_date):
+        missing = []
+        cursor = start_date
+        for start, end in _merge_ranges(self.covered_ranges(code) + self.empty_ranges(code)):
+            if end <= cursor:
+                continue
+            if start >= end_date:
+                break
+            if start > cursor:
+                missing.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < end_date:
+            missing.append((cursor, end_date))
+        return missing
+
+    def extend_to_stored_bar(self, code, start_date, end_date):
+        """未取得の期間 [start, end) を、隣の保存済みの足を1本含むように広げる
+
+        広げた期間を取れば、append_closes で保存済みの足と値を比べられる。
+        """
+        row = self.conn.execute(
+            "SELECT MAX(date) FROM bars WHERE code = ? AND date < ?", (code, start_date),
+        ).fetchone()
+        if row[0]:
+            return row[0], end_date
+        row = self.conn.execute(
+            "SELECT MIN(date) FROM bars WHERE code = ? AND date >= ?", (code, end_date),
+        ).fetchone()
+        if row[0]:
+            return start_date, (date.fromisoformat(row[0]) + timedelta(days=1)).isoformat()
+        return start_date, end_date
+
+    def adjustment_changed(self, code, closes):
+        # 保存済みの足と同じ日の値が違えば、取得元が調整後の終値を計算し直している
+        if closes.empty:
+            return False
+        stored = self.read_closes(code, closes.index[0].strftime("%Y-%m-%d"),
+                                  (closes.index[-1] + timedelta(days=1)).strftime("%Y-%m-%d"))
+        if stored is None:
+            return False
+        stored, fetched = stored.align(closes, join="inner")
+        return not np.allclose(stored.values, fetched.values, rtol=1e-6, atol=0)
+
+    def drop_code(self, code):
+        with self.conn:
+            for table in ("bars", "coverage", "empty_ranges"):
+                self.conn.execute(f"DELETE FROM {table} WHERE code = ?", (code,))
+
+    def append_closes(self, code, closes, start_date, end_date):
+        """取得した終値を追記し、[start, end) を取得済みにする
+
+        保存済みの足と値が合わない（調整が変わった）場合は、その銘柄の足と取得済み
+        期間をすべて捨てて False を返す。呼び出し側で必要な期間を取り直す。
+        """
+        if self.adjustment_changed(code, closes):
+            self.drop_code(code)
+            return False
+        # 当日以降の足は確定していないため取得済み期間には含めない
+        end_date = min(end_date, date.today().isoformat())
+        closes = closes[closes.index < end_date]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO bars (code, date, close) VALUES (?, ?, ?)",
+                [(code, d.strftime("%Y-%m-%d"), float(c)) for d, c in closes.items()],
+            )
+            if start_date >= end_date:
+                return True
+            ranges = self.covered_ranges(code) + [(start_date, end_date)]
+            self.conn.execute("DELETE FROM coverage WHERE code = ?", (code,))
+            self.conn.executemany(
+                "INSERT INTO coverage (code, start_date, end_date) VALUES (?, ?, ?)",
+                [(code, s, e) for s, e in _merge_ranges(ranges)],
+            )
+        return True
+
+    def mark_empty(self, code, start_date, end_date):
+        # 取得元に足がなかった期間。期限が切れるまで missing_ranges に出さない
+        end_date = min(end_date, date.today().isoformat())
+        if start_date >= end_date:
+            return
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM empty_ranges WHERE code = ? AND checked_on <= ?", (code, _empty_range_cutoff()),
+            )
+            self.conn.execute(
+                "INSERT INTO empty_ranges (code, start_date, end_date, checked_on) VALUES (?, ?, ?, ?)",
+                (code, start_date, end_date, date.today().isoformat()),
+            )
+
+    def read_closes(self, code, start_date, end_date):
+        rows = self.conn.execute(
+            "SELECT date, close FROM bars WHERE code = ? AND date >= ? AND date < ? ORDER BY date",
+            (code, start_date, end_date),
+        ).fetchall()
+        if not rows:
+            return None
+        dates, closes = zip(*rows)
+        return pd.Series(closes, index=pd.to_datetime(dates), name="Close")
+
+    def read_close_matrix(self, codes, start_date, end_date, chunk_size=500):
+        # 日付 × 銘柄 の終値表（取れない値は NaN、列は codes の順）
+        rows = []
+        for i in range(0, len(codes), chunk_size):
+            chunk = codes[i:i + chunk_size]
+            rows.extend(self.conn.execute(
+                f"SELECT code, date, close FROM bars WHERE code IN ({', '.join('?' * len(chunk))}) "
+                "AND date >= ? AND date < ?",
+                (*chunk, start_date, end_date),
+            ))
+        column = {code: j for j, code in enumerate(codes)}
+        dates, row_index = np.unique(np.array([row[1] for row in rows], dtype="datetime64[D]"), return_inverse=True)
+        values = np.full((len(dates), len(codes)), np.nan)
+        values[row_index, [column[row[0]] for row in rows]] = [row[2] for row in rows]
+        return pd.DataFrame(values, index=pd.DatetimeIndex(dates), columns=list(codes))
+
+    def get_legacy_report(self, code, year, month):
+        row = self.conn.execute(
+            "SELECT payload FROM legacy_reports WHERE code = ? AND year = ? AND month = ?",
+            (code, year, month),
+        ).fetchone()
+        instrument.cache_lookup("price_report", row is not None)
+        return json.loads(row[0]) if row else None
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def _infer_months(list_dir):
+    # NNyutai.txt に1回だけ現れる銘柄はその月のレポート用とみなす
+    months = {}
+    for path in sorted(Path(list_dir).glob("[01][0-9]yutai.txt")):
+        month = int(path.name[:2])
+        with open(path, "r") as f:
+            for code in {line.strip() for line in f if line.strip()}:
+                months.setdefault(code, []).append(month)
+    return {code: ms[0] for code, ms in months.items() if len(ms) == 1}
+
+
+def _to_plain(value):
+    if isinstance(value, list):
+        return [_to_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _to_plain(v) for k, v in value.items()}
+    if isinstance(value, str):
+        return value
+    return float(value)
+
+
+def import_legacy_cache(store, pkl_path):
+    """旧 yf_cache.pkl（code だけがキーのリスト）を一度だけ取り込む
+
+    旧形式は対象月を持たないため、月は NNyutai.txt から一意に決まる銘柄だけ
+    (code, year, month) の legacy_reports として保存する。日足が取れない場合の
+    代替にのみ使う。
+    """
+    if store.get_meta("legacy_imported") or not Path(pkl_path).exists():
+        return 0
+
+    entries = Cache(pkl_path, "price_report").as_dict().values()
+
+    months = _infer_months(Path(pkl_path).parent)
+    rows = []
+    for entry in entries:
+        code = entry["code"]
+        years = [int(k) for k in entry if k.isdigit()]
+        if code not in months or not years:
+            continue
+        rows.append((code, max(years), months[code], json.dumps(_to_plain(entry), ensure_ascii=False)))
+
+    with store.conn:
+        store.conn.executemany(
+            "INSERT OR IGNORE INTO legacy_reports (code, year, month, payload) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+    store.set_meta("legacy_imported", pkl_path)
+    logging.info(f"旧キャッシュを取り込みました: {len(rows)}/{len(entries)} 件")
+    return len(rows)
@@ -0,0 +1,105 @@
+import json
+import math
+from pathlib import Path
+
+import getyfinance
+import screener
+
+# 詳細データ（年ごとの株価・優待情報）を何銘柄ずつのファイルに分けるか
+SHARD_SIZE = 50
+
+SUMMARY_FIELDS = ["code", "name", "avg1", "avg2", "avg3", "avg4", "avg5", "yutai", "dividend"]
+YUTAI_FIELDS = ["優待内容", "優待利回り", "配当利回り", "最低投資金額", "優待発生株数", "優待権利確定月", "権利確定日"]
+
+
+def data_dir(year):
+    return Path(str(year)) / "data"
+
+
+def index_path(year, month):
+    return data_dir(year) / f"{month:02d}.json"
+
+
+def shard_path(year, month, shard):
+    return data_dir(year) / f"{month:02d}-{shard}.json"
+
+
+def _round(value, digits=None):
+    # percentage は表示時に小数1桁へ丸めるので、ここでは丸めない（二重丸めでずれるため）
+    if value is None or math.isnan(value):
+        return None
+    return float(value) if digits is None else round(float(value), digits)
+
+
+def company_averages(company, year):
+    # render_company の「平均」行と同じ値（列ごとの percentage の平均）
+    percentages = [[] for _ in range(5)]
+    for y in range(year-3, year+1):
+        yearly_data = company.get(str(y), [])
+        if not yearly_data or company.get(f"{y}_rights_price") is None:
+            continue
+        for i, price_data in enumerate(yearly_data[:5]):
+            percentages[i].append(price_data["percentage"])
+    return [sum(values) / len(values) if values else None for values in percentages]
+
+
+def company_record(company, year, name, yutai_info=None):
+    """1銘柄分を (一覧の行, 詳細) の組にする。どちらも JSON にそのまま書ける形"""
+    averages = company_averages(company, year)
+    summary = [company["code"], name, *[_round(a) for a in averages]]
+    if yutai_info:
+        summary += [screener.parse_percent(yutai_info["優待利回り"]), screener.parse_percent(yutai_info["配当利回り"])]
+    else:
+        summary += [None, None]
+
+    years = []
+    for y in range(year, year-4, -1):
+        rights_price = company.get(f"{y}_rights_price")
+        yearly_data = company.get(str(y), [])
+        if not yearly_data or rights_price is None:
+            years.append([y, None, []])
+            continue
+        years.append([
+            y, _round(rights_price, 2),
+            [[_round(d["price"], 2), _round(d["percentage"])] for d in yearly_data],
+        ])
+    detail = {
+        "years": years,
+        "yutai": [yutai_info[key] for key in YUTAI_FIELDS] if yutai_info else None,
+    }
+    return summary, detail
+
+
+def dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), allow_nan=False)
+
+
+def month_files(year, month, records):
+    """月の一覧 (NN.json) と詳細の分割ファイル (NN-k.json) を {パス: 内容} で返す
+
+    ビューアは一覧だけを最初に読み、画面に入った銘柄の詳細ファイルだけを後から読む。
+    """
+    header_months = [(m - 1) % 12 + 1 for m in range(month-3, month+2)]
+    shards = [records[i:i + SHARD_SIZE] for i in range(0, len(records), SHARD_SIZE)]
+    index = {
+        "year": year,
+        "month": month,
+        "columns": [f"{m:02d}" for m in header_months],
+        "fields": SUMMARY_FIELDS,
+        "thresholds": [[limit, name] for limit, name in getyfinance.CONFIG['COLOR_THRESHOLDS'].items()],
+        "shard_size": SHARD_SIZE,
+        "shards": len(shards),
+        "rows": [summary for summary, _ in records],
+    }
+    files = {index_path(year, month): dumps(index)}
+    for shard, chunk in enumerate(shards):
+        files[shard_path(year, month, shard)] = dumps({"companies": [detail for _, detail in chunk]})
+    return files
+
+
+def stale_shards(year, month, files):
+    # 銘柄が減って使われなくなった分割ファイル
+    return [
+        path for path in data_dir(year).glob(f"{month:02d}-*.json")
+        if path not in files
+    ]
@@ -0,0 +1,285 @@
+import argparse
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import getyfinance
+import instrument
+import make_yutai_data
+import master_index
+import screener
+from pipeline import BASE_DIR, add_yutai_info
+from price_store import PriceStore
+
+# 描画済みのページ・銘柄ごとの断片をいくつまでメモリに置くか
+PAGE_CACHE_SIZE = 64
+FRAGMENT_CACHE_SIZE = 20000
+
+REPORT_PATH = re.compile(r"/(\d{4})/(\d{1,2})(?:\.html)?/?")
+CODE = re.compile(r"^[0-9A-Z]{4}$")
+
+INDEX_TEMPLATE = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+  <meta charset="UTF-8">
+  <title>株価月別レポート（サーバー）</title>
+</head>
+<body>
+  <h1>{year}年 株価月別レポート</h1>
+  <ul>
+{links}  </ul>
+  <form action="/{year}/{month:02d}">
+    銘柄コード（カンマ区切り）：<input name="codes" size="40">
+    <button>表示</button>
+  </form>
+</body>
+</html>
+"""
+
+
+class LRU:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def set(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ReportService:
+    """銘柄名の索引・株価ストア・優待情報を開いたまま保持し、レポートを要求時に描画する
+
+    描画したページと銘柄ごとの断片はメモリに置き、元データのファイル
+    （prices.db・優待キャッシュ・data_j.xls・優待銘柄一覧）が更新されたら捨てる。
+    fetch=True なら未取得の株価・優待情報をその場で取得する。
+
+    lock はメモリ上の状態（ページ・断片・読み込んだ元データ）だけを守り、描画済みの
+    ページはすぐに返す。取得と描画は株価ストアと優待キャッシュを共有するため
+    render_lock で1件ずつ行う。
+    """
+
+    def __init__(self, fetch=True):
+        self.fetch = fetch
+        self.lock = threading.RLock()
+        self.render_lock = threading.Lock()
+        self.pages = LRU(PAGE_CACHE_SIZE)
+        self.fragments = LRU(FRAGMENT_CACHE_SIZE)
+        self.store = PriceStore(getyfinance.CONFIG['PRICE_DB_FILE'], check_same_thread=False)
+        self.name_dict = None
+        self.yutai_cache = None
+        self.universe = None
+        self.version = None
+        self.refresh()
+
+    def data_files(self):
+        return [
+            getyfinance.CONFIG['PRICE_DB_FILE'], add_yutai_info.CACHE_FILE, "data_j.xls", make_yutai_data.CACHE_FILE,
+        ]
+
+    def current_version(self):
+        return tuple(file_signature(path) for path in self.data_files())
+
+    def refresh(self):
+        # 元データが変わっていたら読み直し、描画結果を捨てる
+        version = self.current_version()
+        if version == self.version:
+            return
+        if self.version is None or version[1] != self.version[1]:
+            self.yutai_cache = add_yutai_info.open_yutai_cache()
+        if self.version is None or version[2] != self.version[2]:
+            self.name_dict = getyfinance.load_name_dict_from_excel()
+            # 索引の作り直しは要求の処理中ではなく、ここで済ませておく
+            master_index.ensure_index(self.name_dict.xls_path, self.name_dict.index_path)
+        if self.version is None or version[3] != self.version[3]:
+            self.universe = make_yutai_data.load_cached_universe()
+        if self.version is not None:
+            logging.info("元データが更新されたため描画結果を破棄します")
+        self.pages.clear()
+        self.fragments.clear()
+        self.version = version
+
+    def month_codes(self, month):
+        path = screener.code_list_file(month)
+        if not os.path.exists(path):
+            return None
+        return getyfinance.load_codes(path)
+
+    def cached_page(self, key):
+        with self.lock:
+            self.refresh()
+            return self.pages.get(key)
+
+    def report(self, year, month, codes):
+        """(HTML, メモから返したか) を返す"""
+        key = (year, month, tuple(codes))
+        # 描画済みのページは、別の要求が取得・描画している最中でも待たずに返す
+        page = self.cached_page(key)
+        instrument.cache_lookup("server_page", page is not None)
+        if page is not None:
+            return page, True
+
+        with self.render_lock:
+            # 待っている間に同じページが描画されていればそれを返す
+            page = self.cached_page(key)
+            if page is not None:
+                return page, True
+            with instrument.timer("server.render"):
+                page = self.render(year, month, codes)
+            with self.lock:
+                # 描画中の取得で元データが更新されても、この結果は新しいデータで作ったものとして残す
+                self.refresh()
+                self.pages.set(key, page)
+        return page, False
+
+    def render(self, year, month, codes):
+        # 描画中に元データの更新で断片が捨てられても困らないよう、使う断片は手元に集める
+        with self.lock:
+            fragments = {code: self.fragments.get((year, month, code)) for code in codes}
+        missing = [code for code, fragment in fragments.items() if fragment is None]
+        if missing:
+            start_date, end_date = getyfinance.get_history_range(year, month)
+            if self.fetch:
+                histories = getyfinance.load_price_histories(self.store, missing, start_date, end_date)
+                if add_yutai_info.fetch_missing_yutai_info(missing, self.yutai_cache):
+                    self.yutai_cache.save()
+            else:
+                histories = {code: self.store.read_closes(code, start_date, end_date) for code in missing}
+
+            header_row = getyfinance.render_header_row(month)
+            classify = getyfinance.make_css_classifier()
+            for code in missing:
+                company = getyfinance.build_company_from_history(
+                    code, year, month, self.name_dict, histories.get(code), self.store,
+                )
+                yutai_info = add_yutai_info.merge_yutai_info(code, self.yutai_cache, self.universe)
+                fragments[code] = getyfinance.render_company(
+                    company, year, self.name_dict, header_row, classify, True, yutai_info,
+                )
+            with self.lock:
+                for code in missing:
+                    self.fragments.set((year, month, code), fragments[code])
+
+        parts = [getyfinance.FINAL_HTML_HEADER]
+        parts.extend(fragments[code] for code in codes)
+        parts.append(getyfinance.HTML_FOOTER)
+        return "".join(parts)
+
+    def index(self, year):
+        links = "".join(
+            f'    <li><a href="/{year}/{month:02d}">{month}月レポート</a></li>\n'
+            for month in range(1, 13) if os.path.exists(screener.code_list_file(month))
+        )
+        return INDEX_TEMPLATE.format(year=year, month=1, links=links)
+
+
+def parse_codes(text):
+    codes = [code.strip().upper() for code in re.split(r"[,\s]+", text) if code.strip()]
+    invalid = [code for code in codes if not CODE.match(code)]
+    if invalid:
+        raise ValueError(f"銘柄コードが不正です: {', '.join(invalid)}")
+    return list(dict.fromkeys(codes))
+
+
+def make_handler(service, default_year):
+    class ReportHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path in ("", "/"):
+                self.send_html(service.index(default_year))
+                return
+
+            match = REPORT_PATH.fullmatch(url.path)
+            if not match or not 1 <= int(match.group(2)) <= 12:
+                self.send_error(404)
+                return
+            year, month = int(match.group(1)), int(match.group(2))
+
+            query = parse_qs(url.query)
+            if "codes" in query:
+                try:
+                    codes = parse_codes(",".join(query["codes"]))
+                except ValueError as e:
+                    self.send_error(400, explain=str(e))
+                    return
+            else:
+                codes = service.month_codes(month)
+                if codes is None:
+                    self.send_error(404, explain=f"{screener.code_list_file(month)} がありません")
+                    return
+
+            try:
+                page, cached = service.report(year, month, codes)
+            except Exception as e:
+                logging.exception(f"レポートの作成に失敗: {year}/{month:02d}")
+                self.send_error(500, explain=str(e))
+                return
+            self.send_html(page, {"X-Report-Cache": "hit" if cached else "miss"})
+
+        def send_html(self, page, headers=None):
+            data = page.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logging.info(f"{self.address_string()} {format % args}")
+
+    return ReportHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="月別レポートを要求時に描画するローカルサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--year", type=int, default=2024, help="トップページに並べる年")
+    parser.add_argument("--no-fetch", action="store_true", help="保存済みの株価・優待情報だけで描画する")
+    parser.add_argument("--price-fixtures", default=None, help="株価をネットワークではなく {code}.csv のディレクトリから読む")
+    args = parser.parse_args()
+
+    if args.price_fixtures:
+        getyfinance.CONFIG['PRICE_FIXTURE_DIR'] = os.path.abspath(args.price_fixtures)
+
+    # 各スクリプトは kabuka/ をカレントディレクトリとして相対パスでファイルを扱う
+    os.chdir(BASE_DIR)
+    service = ReportService(fetch=not args.no_fetch)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service, args.year))
+    print(f"http://{args.host}:{args.port}/ で待ち受けています（/YYYY/MM, /YYYY/MM?codes=7203,6758）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import heapq
+import logging
+import re
+
+import numpy as np
+
+import getyfinance
+import seasonal
+from price_store import PriceStore
+
+# スコア = 優待利回り × rate + 配当利回り × dividend + 権利月前後の平均騰落率 × price（いずれも %）
+WEIGHTS = {"rate": 1.0, "dividend": 1.0, "price": 1.0}
+
+# 権利月の前月前半に買い、翌月前半に売ったときの騰落率を見る
+ENTRY_OFFSET = -1
+EXIT_OFFSET = 1
+
+PERCENT = re.compile(r"-?\d+(?:\.\d+)?")
+MONTH = re.compile(r"(\d+)月")
+
+
+def code_list_file(month):
+    return f"{month:02d}yutai.txt"
+
+
+def parse_percent(text):
+    # "2.35%" → 2.35、"-" や取得できない値は 0
+    match = PERCENT.search(str(text or ""))
+    return float(match.group()) if match else 0.0
+
+
+def load_dividends(universe):
+    # 配当利回りは全銘柄に同じ条件でそろう検索結果（universe）だけから取る。個別ページの保存分は
+    # 過去にレポートに載った銘柄にしかなく、混ぜるとそれらの銘柄ばかり選ばれ続ける
+    return {code: info["dividend"] for code, info in universe.items() if info.get("dividend") is not None}
+
+
+def universe_months(universe):
+    # month → その月に権利が確定する銘柄（universe の順）
+    by_month = {month: [] for month in range(1, 13)}
+    for code, info in universe.items():
+        months = {int(match.group(1)) for match in map(MONTH.match, info["months"]) if match}
+        for month in months & set(by_month):
+            by_month[month].append(code)
+    return by_month
+
+
+def load_close_matrix(store, codes, year, lookback=4, fetch=True):
+    # 12ヶ月分のウィンドウをすべて覆う期間を一度に読む
+    ranges = [seasonal.history_range(year, month, lookback) for month in range(1, 13)]
+    start_date, end_date = min(r[0] for r in ranges), max(r[1] for r in ranges)
+    if fetch:
+        getyfinance.load_price_histories(store, codes, start_date, end_date)
+    return store.read_close_matrix(codes, start_date, end_date)
+
+
+def price_returns(matrix, year, month, lookback=4):
+    """ENTRY_OFFSET の月に買い EXIT_OFFSET の月に売ったときの平均騰落率（%）を全銘柄まとめて求める"""
+    table = seasonal.seasonal_table(matrix, year, month, lookback, pack=False)
+    entry = seasonal.OFFSETS.index(ENTRY_OFFSET)
+    exit_ = seasonal.OFFSETS.index(EXIT_OFFSET)
+    returns = (table["prices"][:, exit_] / table["prices"][:, entry] - 1) * 100
+    present = ~np.isnan(returns)
+    count = present.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, np.where(present, returns, 0.0).sum(axis=0) / count, np.nan)
+    return {code: float(value) for code, value in zip(table["codes"], mean) if not np.isnan(value)}
+
+
+def score(code, universe, dividends, returns, weights=WEIGHTS):
+    return (
+        weights["rate"] * universe[code]["rate"]
+        + weights["dividend"] * dividends.get(code, 0.0)
+        + weights["price"] * returns.get(code, 0.0)
+    )
+
+
+def screen(universe, year, top_n, matrix=None, dividends=None, lookback=4, weights=WEIGHTS):
+    """12ヶ月分の上位 top_n 銘柄を {month: [code, ...]} で返す
+
+    matrix（日付 × 銘柄 の終値表）がなければ株価の項は 0 として扱う。
+    配当利回りのない銘柄（検索結果で "---"）は配当の項を 0 とする。
+    同点のときは universe の順を保つ。
+    """
+    dividends = dividends or {}
+    selections = {}
+    for month, codes in universe_months(universe).items():
+        returns = price_returns(matrix, year, month, lookback) if matrix is not None else {}
+        selections[month] = heapq.nlargest(
+            top_n, codes, key=lambda code: score(code, universe, dividends, returns, weights)
+        )
+    return selections
+
+
+def write_code_lists(selections):
+    for month, codes in selections.items():
+        with open(code_list_file(month), "w", encoding="utf-8") as f:
+            for code in codes:
+                f.write(code + "\n")
+
+
+def run(universe, year, top_n, lookback=4, fetch=True, weights=WEIGHTS):
+    codes = list(universe)
+    store = PriceStore(getyfinance.CONFIG['PRICE_DB_FILE'])
+    matrix = load_close_matrix(store, codes, year, lookback, fetch)
+    store.close()
+
+    selections = screen(universe, year, top_n, matrix, load_dividends(universe), lookback, weights)
+    write_code_lists(selections)
+    for month, selected in selections.items():
+        logging.info(f"{month:02d}月: {len(selected)} 銘柄を選定")
+    return selections
@@ -0,0 +1,165 @@
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+import getyfinance
+from price_store import PriceStore
+
+# 権利月からの相対月（getyfinance.get_target_months と同じ 3ヶ月前〜翌月）
+OFFSETS = (-3, -2, -1, 0, 1)
+
+
+class WindowMeans:
+    """日付 × 銘柄 の終値表から、任意の期間 [start, end) の平均を全銘柄まとめて求める
+
+    累積和と取れた本数の累積を一度だけ作っておき、各期間は searchsorted で
+    行位置を求めて差を取るだけにする（期間あたり O(銘柄数)）。
+    """
+
+    def __init__(self, matrix):
+        self.codes = list(matrix.columns)
+        self.dates = matrix.index.values.astype("datetime64[ns]")
+        values = matrix.to_numpy(dtype="float64")
+        present = ~np.isnan(values)
+        zeros = np.zeros((1, values.shape[1]))
+        self.sums = np.vstack([zeros, np.cumsum(np.where(present, values, 0.0), axis=0)])
+        self.counts = np.vstack([zeros, np.cumsum(present, axis=0)])
+
+    def mean(self, start_date, end_date):
+        i, j = np.searchsorted(self.dates, np.array([start_date, end_date], dtype="datetime64[ns]"))
+        count = self.counts[j] - self.counts[i]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(count > 0, (self.sums[j] - self.sums[i]) / count, np.nan)
+
+
+def shift_month(year, month, offset):
+    index = year * 12 + (month - 1) + offset
+    return index // 12, index % 12 + 1
+
+
+def _pack_left(values, valid):
+    # build_company_data と同じく、取れた月だけを左から詰める
+    order = np.argsort(~valid, axis=1, kind="stable")
+    packed = np.take_along_axis(values, order, axis=1)
+    packed[~np.take_along_axis(valid, order, axis=1)] = np.nan
+    return packed
+
+
+def seasonal_table(matrix, year, month, lookback=4, offsets=OFFSETS, window=None, pack=True):
+    """全銘柄について「各月の前半平均 ÷ 権利月末週の平均」を年 × 月でまとめて計算する
+
+    matrix は日付 × 銘柄 の終値表（PriceStore.read_close_matrix など）。
+    window(year, month, is_first_decade) で期間を差し替えられる。戻り値の
+    prices / percentages は (年, 月, 銘柄) の配列で、レポートと同じく取れた月を
+    左に詰めている（pack=False なら offsets の位置のまま）。averages はレポートの
+    「平均」行にあたる (月, 銘柄) の配列。
+    """
+    window = window or getyfinance.get_window
+    means = WindowMeans(matrix)
+    years = list(range(year - lookback + 1, year + 1))
+
+    rights = np.array([means.mean(*window(y, month, False)) for y in years])
+    prices = np.array([
+        [means.mean(*window(*shift_month(y, month, offset))) for offset in offsets]
+        for y in years
+    ])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        percentages = prices / rights[:, None, :] * 100
+
+    # 権利月の株価が取れない年は行ごと「データなし」になる
+    valid = ~np.isnan(prices) & ~np.isnan(rights)[:, None, :]
+    if pack:
+        prices = _pack_left(prices, valid)
+        percentages = _pack_left(percentages, valid)
+    else:
+        prices = np.where(valid, prices, np.nan)
+        percentages = np.where(valid, percentages, np.nan)
+
+    present = ~np.isnan(percentages)
+    count = present.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        averages = np.where(count > 0, np.where(present, percentages, 0.0).sum(axis=0) / count, np.nan)
+
+    return {
+        "codes": means.codes,
+        "years": years,
+        "rights": rights,
+        "prices": prices,
+        "percentages": percentages,
+        "averages": averages,
+    }
+
+
+def company_data(table, index, name_dict):
+    # seasonal_table の1銘柄分を build_company_data と同じ形の dict に戻す
+    code = table["codes"][index]
+    company = {"code": code, "name": getyfinance.get_company_name(code, name_dict)}
+    for row, y in enumerate(table["years"]):
+        rights_price = table["rights"][row, index]
+        if np.isnan(rights_price):
+            continue
+        company[f"{y}_rights_price"] = float(rights_price)
+        yearly_data = [
+            {"price": float(price), "percentage": float(percentage)}
+            for price, percentage in zip(table["prices"][row, :, index], table["percentages"][row, :, index])
+            if not np.isnan(price)
+        ]
+        if yearly_data:
+            company[str(y)] = yearly_data
+    return company
+
+
+def history_range(year, month, lookback=4, offsets=OFFSETS, window=None):
+    # seasonal_table が参照する全期間を覆う [start, end)
+    window = window or getyfinance.get_window
+    windows = []
+    for y in range(year - lookback + 1, year + 1):
+        windows.append(window(y, month, False))
+        windows.extend(window(*shift_month(y, month, offset)) for offset in offsets)
+    return min(w[0] for w in windows), max(w[1] for w in windows)
+
+
+def load_close_matrix(store, codes, year, month, lookback=4, fetch=True):
+    start_date, end_date = history_range(year, month, lookback)
+    if fetch:
+        getyfinance.load_price_histories(store, codes, start_date, end_date)
+    return store.read_close_matrix(codes, start_date, end_date)
+
+
+def averages_frame(table, name_dict, month):
+    columns = [f"{shift_month(2000, month, offset)[1]:02d}" for offset in OFFSETS]
+    frame = pd.DataFrame(table["averages"].T, index=table["codes"], columns=columns)
+    frame.insert(0, "name", [getyfinance.get_company_name(code, name_dict) for code in table["codes"]])
+    return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全銘柄の権利月前後の株価比率をまとめて計算する")
+    parser.add_argument("--year", type=int, required=True)
+    parser.add_argument("--month", type=int, required=True)
+    parser.add_argument("--codes", help="銘柄コードの一覧ファイル（省略時は上場銘柄すべて）")
+    parser.add_argument("--lookback", type=int, default=4, help="遡る年数")
+    parser.add_argument("--no-fetch", action="store_true", help="保存済みの日足だけを使う")
+    parser.add_argument("--output", help="TSV の出力先（省略時は標準出力）")
+    args = parser.parse_args()
+
+    name_dict = getyfinance.load_name_dict_from_excel()
+    codes = getyfinance.load_codes(args.codes) if args.codes else list(name_dict)
+
+    store = PriceStore(getyfinance.CONFIG['PRICE_DB_FILE'])
+    matrix = load_close_matrix(store, codes, args.year, args.month, args.lookback, fetch=not args.no_fetch)
+    store.close()
+
+    table = seasonal_table(matrix, args.year, args.month, args.lookback)
+    frame = averages_frame(table, name_dict, args.month)
+    logging.info(f"計算完了: {len(codes)} 銘柄 × {args.lookback} 年")
+    if args.output:
+        frame.to_csv(args.output, sep="\t", float_format="%.1f")
+    else:
+        print(frame.to_csv(sep="\t", float_format="%.1f"), end="")
+
+
+if __name__ == "__main__":
+    main()
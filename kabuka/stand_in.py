@@ -0,0 +1,105 @@
+import hashlib
+import re
+import threading
+from contextlib import contextmanager
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+# ベンチマークとテストが共有する代替サーバー（みんかぶの検索・優待ページを返す）
+
+NOISE = "".join(
+    f'<div class="md_box"><a href="/news/{i}">ニュース{i}</a><p>{"本文" * 40}</p></div>' for i in range(300)
+)
+
+
+def make_search_page(page, items=20):
+    # みんかぶの検索結果ページと同じ構造の li を並べ、周囲に無関係な要素を足す
+    lis = []
+    for i in range(items):
+        code = 1000 + page * items + i
+        lis.append(
+            f'<li class="yutai_rank_style"><div class="fwb"><a class="fwb" href="/stock/{code}/yutai">銘柄{code}(東証)</a></div>'
+            f'<div class="yutai_item">優待品{code}</div>'
+            f'<div class="mr8">株主優待利回り<span class="fsn fwb fcrd">{(code % 50) / 10}</span>%</div>'
+            f'<div class="mr8">配当利回り<span class="fsn fwb">1.5</span>%</div>'
+            f'<div><span class="md_ico_tx">権利確定月</span><span class="fsm fwb">{code % 12 + 1}月</span></div>'
+            f'<span class="fsm">{code % 30 + 5}.0</span></li>'
+        )
+    return f"<html><head><script>{'var x=1;' * 500}</script></head><body>{NOISE}<ul>{''.join(lis)}</ul>{NOISE}</body></html>"
+
+
+def make_detail_page(code):
+    rows = [
+        ("最低投資金額", f"{code * 10:,}円"),
+        ("優待発生株数", "100"),
+        ("優待権利確定月", f"{code % 12 + 1}月"),
+        ("権利確定日", "月末"),
+    ]
+    table = "".join(f"<tr><th>{label}</th><td>{value}</td></tr>" for label, value in rows)
+    return (
+        f"<html><head><script>{'var x=1;' * 500}</script></head><body>{NOISE}"
+        f'<h3 id="yutai_summary">優待品{code}</h3>'
+        f'<table><tr><td id="yutai_valuations_yutai">{code % 50 / 10}%</td><td id="yutai_valuations_haito">1.5%</td></tr>{table}</table>'
+        f"{NOISE}</body></html>"
+    )
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """みんかぶの代わりに記録済みの HTML を返す。記録がないページはその場で合成する
+
+    ETag / Last-Modified を付け、If-None-Match / If-Modified-Since が一致すれば 304 を返す。
+    """
+
+    fixture_dir = None  # 記録済みの HTML のディレクトリ（minkabu/search, minkabu/stock）。None なら常に合成する
+    last_modified = formatdate(0, usegmt=True)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        stock = re.fullmatch(r"/stock/(\d+)/yutai", url.path)
+        if url.path == "/yutai/search":
+            page = int(parse_qs(url.query).get("page", ["1"])[0])
+            body = self.recorded("search", f"page_{page:04d}.html") or make_search_page(page)
+        elif stock:
+            body = self.recorded("stock", f"{stock.group(1)}.html") or make_detail_page(int(stock.group(1)))
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        etag = f'"{hashlib.sha1(data).hexdigest()[:16]}"'
+        if_none_match = self.headers.get("If-None-Match")
+        if (if_none_match == etag if if_none_match
+                else self.headers.get("If-Modified-Since") == self.last_modified):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", self.last_modified)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def recorded(self, kind, name):
+        path = self.fixture_dir and Path(self.fixture_dir) / "minkabu" / kind / name
+        return path.read_text(encoding="utf-8") if path and path.exists() else None
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve(handler, **attrs):
+    """handler（attrs で属性を差し替えた派生クラス）を 127.0.0.1 の空いているポートで別スレッドから動かし、ベース URL を返す"""
+    handler = type(handler.__name__, (handler,), attrs)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
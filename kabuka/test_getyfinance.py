@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import getyfinance
+from fetch_pool import TokenBucket
+
+CODE = "7203"
+YEAR = 2024
+
+
+def make_closes(days):
+    # 値が日ごとに変わる決まった系列（平均がウィンドウの取り方で変わるように）
+    index = pd.DatetimeIndex(days)
+    return pd.Series(1000 + 50 * np.sin(np.arange(len(index)) / 7), index=index, name="Close")
+
+
+class FakeTicker:
+    closes = None
+
+    def __init__(self, symbol):
+        assert symbol == f"{CODE}.T"
+
+    def history(self, start, end):
+        window = self.closes[(self.closes.index >= start) & (self.closes.index < end)]
+        return pd.DataFrame({"Close": window})
+
+
+@pytest.fixture
+def fake_yfinance(monkeypatch):
+    monkeypatch.setattr(getyfinance.yf, "Ticker", FakeTicker)
+    monkeypatch.setattr(getyfinance, "_rate_limiter", TokenBucket(10000))
+    return FakeTicker
+
+
+def by_window(month):
+    # 従来どおりウィンドウごとに history() を呼ぶ経路
+    return getyfinance.build_company_data(
+        CODE, YEAR, month, {},
+        lambda y, m, first=True: getyfinance.get_average_price(CODE, y, m, first),
+    )
+
+
+def from_history(closes, month):
+    # 全期間の日足を一度に取り、メモリ上で切り出す経路
+    return getyfinance.build_company_from_history(CODE, YEAR, month, {}, closes)
+
+
+@pytest.mark.parametrize("month", range(1, 13))
+def test_calendar_mode_matches_per_window_fetch(monkeypatch, fake_yfinance, month):
+    monkeypatch.setitem(getyfinance.CONFIG, "WINDOW_MODE", "calendar")
+    start_date, end_date = getyfinance.get_history_range(YEAR, month)
+    fake_yfinance.closes = make_closes(pd.bdate_range(start_date, end_date, inclusive="left"))
+
+    expected = by_window(month)
+    assert f"{YEAR}_rights_price" in expected
+    assert from_history(fake_yfinance.closes, month) == expected
+
+
+@pytest.mark.parametrize("month", range(1, 13))
+def test_trading_mode_matches_per_window_fetch(monkeypatch, fake_yfinance, month):
+    monkeypatch.setitem(getyfinance.CONFIG, "WINDOW_MODE", "trading")
+    start_date, end_date = getyfinance.get_history_range(YEAR, month)
+    # 東証の休業日に足があると営業日の配列に並ばないので、営業日だけの系列にする
+    days = getyfinance.get_trading_calendar(YEAR - 3, YEAR + 1).days
+    days = days[(days >= np.datetime64(start_date)) & (days < np.datetime64(end_date))]
+    fake_yfinance.closes = make_closes(days)
+
+    expected = by_window(month)
+    assert f"{YEAR}_rights_price" in expected
+    assert from_history(fake_yfinance.closes, month) == expected
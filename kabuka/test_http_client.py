@@ -0,0 +1,85 @@
+import pytest
+
+from http_client import ResponseCache, fetch_cached
+from stand_in import StandInHandler, serve
+
+
+class LastModifiedOnlyHandler(StandInHandler):
+    """ETag を返さず Last-Modified だけで検証するサーバー"""
+
+    def send_header(self, keyword, value):
+        if keyword != "ETag":
+            super().send_header(keyword, value)
+
+
+class CountingParser:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return {"length": len(text)}
+
+
+@pytest.fixture
+def fixture_dir(tmp_path):
+    stock_dir = tmp_path / "fixtures" / "minkabu" / "stock"
+    stock_dir.mkdir(parents=True)
+    (stock_dir / "1234.html").write_text("<html>優待品A</html>", encoding="utf-8")
+    return tmp_path / "fixtures"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(tmp_path / "http_cache")
+
+
+def test_etag_304_reuses_body_and_parse(fixture_dir, cache):
+    parse = CountingParser()
+    with serve(StandInHandler, fixture_dir=fixture_dir) as base_url:
+        url = f"{base_url}/stock/1234/yutai"
+        first = fetch_cached(url, cache=cache)
+        assert not first.not_modified
+        assert first.parse(parse, key="count") == {"length": len(first.text)}
+
+        second = fetch_cached(url, cache=cache)
+        assert second.not_modified
+        assert second.status_code == 200
+        assert second.text == "<html>優待品A</html>"
+        assert second.parse(parse, key="count") == {"length": len(first.text)}
+    assert parse.calls == 1
+
+
+def test_last_modified_only_server_gets_304(fixture_dir, cache):
+    with serve(LastModifiedOnlyHandler, fixture_dir=fixture_dir) as base_url:
+        url = f"{base_url}/stock/1234/yutai"
+        first = fetch_cached(url, cache=cache)
+        assert first.entry["etag"] is None
+        assert first.entry["last_modified"]
+
+        second = fetch_cached(url, cache=cache)
+    assert second.not_modified
+    assert second.text == first.text
+
+
+def test_changed_body_is_parsed_again(fixture_dir, cache):
+    parse = CountingParser()
+    with serve(StandInHandler, fixture_dir=fixture_dir) as base_url:
+        url = f"{base_url}/stock/1234/yutai"
+        fetch_cached(url, cache=cache).parse(parse, key="count")
+
+        (fixture_dir / "minkabu" / "stock" / "1234.html").write_text("<html>優待品AとB</html>", encoding="utf-8")
+        changed = fetch_cached(url, cache=cache)
+        assert not changed.not_modified
+        assert changed.parse(parse, key="count") == {"length": len("<html>優待品AとB</html>")}
+    assert parse.calls == 2
+    assert cache.get(url)["parsed"]["count"] == {"length": len("<html>優待品AとB</html>")}
+
+
+def test_non_200_is_not_stored(fixture_dir, cache):
+    with serve(StandInHandler, fixture_dir=fixture_dir) as base_url:
+        url = f"{base_url}/no/such/page"
+        res = fetch_cached(url, cache=cache)
+    assert res.status_code == 404
+    assert cache.get(url) is None
+    assert not cache.path.exists() or not any(cache.path.iterdir())
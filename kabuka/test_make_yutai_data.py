@@ -0,0 +1,89 @@
+import os
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import fetch_pool
+import http_client
+import make_yutai_data
+from http_client import ResponseCache
+from stand_in import StandInHandler, make_search_page, serve
+
+LAST_PAGE = 5
+ITEMS = (LAST_PAGE - make_yutai_data.FIRST_PAGE + 1) * 20  # make_search_page は1ページ 20 銘柄
+PAGER = "".join(f'<a href="/yutai/search?page={page}">{page}</a>' for page in (3, 4, LAST_PAGE))
+
+
+class RecordingHandler(StandInHandler):
+    """要求された検索ページ番号を記録し、fail_pages のページには 404 を返す"""
+
+    requested = []
+    fail_pages = set()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        page = int(parse_qs(url.query).get("page", ["1"])[0])
+        self.requested.append(page)
+        if page in self.fail_pages:
+            self.send_error(404)
+            return
+        super().do_GET()
+
+
+@pytest.fixture
+def crawler(tmp_path, monkeypatch):
+    # 保存済みの検索ページ（ページャー付き）を代替サーバーから返す
+    search_dir = tmp_path / "fixtures" / "minkabu" / "search"
+    search_dir.mkdir(parents=True)
+    for page in range(make_yutai_data.FIRST_PAGE, LAST_PAGE + 1):
+        html = make_search_page(page).replace("</body>", f'<div class="pager">{PAGER}</div></body>')
+        (search_dir / f"page_{page:04d}.html").write_text(html, encoding="utf-8")
+
+    monkeypatch.setattr(make_yutai_data, "CRAWL_DIR", tmp_path / "yutai_crawl")
+    monkeypatch.setattr(make_yutai_data, "CRAWL_RATE", 10000)
+    monkeypatch.setattr(fetch_pool, "backoff_delay", lambda attempt, base_delay: 0)
+    monkeypatch.setattr(http_client, "_response_cache", ResponseCache(tmp_path / "http_cache"))
+    handler = type("Handler", (RecordingHandler,), {"requested": [], "fail_pages": set()})
+    with serve(handler, fixture_dir=tmp_path / "fixtures") as base_url:
+        monkeypatch.setattr(make_yutai_data, "BASE_URL", f"{base_url}/yutai/search")
+        yield handler
+
+
+def checkpoint_pages():
+    return sorted(int(path.stem.split("_")[1]) for path in Path(make_yutai_data.CRAWL_DIR).glob("page_*.json"))
+
+
+def test_failed_page_keeps_checkpoints_and_resumes(crawler):
+    crawler.fail_pages = {4}
+    with pytest.raises(RuntimeError):
+        make_yutai_data.fetch_all_yutai_data()
+
+    # ページャーのページ数で打ち切るので、最終ページの先は取りに行かない
+    assert set(crawler.requested) == {2, 3, 4, 5}
+    assert crawler.requested.count(4) == 3  # call_with_retry の既定の試行回数
+    assert checkpoint_pages() == [2, 3, 5]
+
+    crawler.fail_pages = set()
+    crawler.requested.clear()
+    result = make_yutai_data.fetch_all_yutai_data()
+
+    assert crawler.requested == [4]
+    assert len(result) == ITEMS
+    assert not Path(make_yutai_data.CRAWL_DIR).exists()
+
+
+def test_stale_checkpoints_are_fetched_again(crawler):
+    crawler.fail_pages = {4}
+    with pytest.raises(RuntimeError):
+        make_yutai_data.fetch_all_yutai_data()
+
+    # 優待銘柄一覧の有効期間より前に保存したページは続きに使わない
+    stale = time.time() - make_yutai_data.TTL["yutai_universe"] - 1
+    os.utime(make_yutai_data.checkpoint_path(3), (stale, stale))
+    crawler.fail_pages = set()
+    crawler.requested.clear()
+    make_yutai_data.fetch_all_yutai_data()
+
+    assert sorted(crawler.requested) == [3, 4]
@@ -0,0 +1,241 @@
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+import requests
+import yfinance
+from yfinance.exceptions import YFPricesMissingError
+
+from fetch_pool import TokenBucket
+from price_source import FixtureSource, YFinanceSource, fetch_closes
+from stand_in import serve
+
+START, END = "2024-01-01", "2024-02-01"
+CODES = [str(1000 + i) for i in range(20)]
+
+
+class PriceHandler(BaseHTTPRequestHandler):
+    """代替の株価サーバー: GET /prices?codes=...&start=...&end=... に銘柄ごとの終値を JSON で返す
+
+    fail_always の銘柄を含む要求には常に 503 を返し、fail_times[code] の銘柄は
+    その回数だけ 503 を返してから成功する。slow の銘柄を含む要求は delay 秒待つ。
+    drop の銘柄は複数銘柄の要求では 200 のまま結果から落とす（yf.download() と同じ）。
+    """
+
+    fail_always = set()
+    fail_times = {}
+    slow = set()
+    delay = 0.2
+    drop = set()
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        codes = query["codes"][0].split(",")
+        start_date, end_date = query["start"][0], query["end"][0]
+        with self.lock:
+            self.calls.append(tuple(codes))
+            flaky = [code for code in codes if self.fail_times.get(code, 0) > 0]
+            for code in flaky:
+                self.fail_times[code] -= 1
+        if self.slow & set(codes):
+            time.sleep(self.delay)
+        with self.lock:
+            self.finished.append(tuple(codes))
+        if self.fail_always & set(codes) or flaky:
+            self.send_error(503)
+            return
+        days = [day.strftime("%Y-%m-%d") for day in pd.date_range(start_date, end_date, inclusive="left")]
+        kept = [code for code in codes if len(codes) == 1 or code not in self.drop]
+        data = json.dumps({code: [[day, float(code)] for day in days] for code in kept}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpSource:
+    """代替の株価サーバーから HTTP で終値を取る取得元"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def download_closes(self, codes, start_date, end_date):
+        res = requests.get(
+            f"{self.base_url}/prices", params={"codes": ",".join(codes), "start": start_date, "end": end_date}, timeout=10,
+        )
+        res.raise_for_status()
+        return {
+            code: pd.Series([close for _, close in rows], index=pd.DatetimeIndex([day for day, _ in rows]), dtype=float)
+            for code, rows in res.json().items()
+        }
+
+
+@contextmanager
+def price_server(**behavior):
+    # 要求の記録はテストごとの派生クラスに持たせる
+    handler = type("Handler", (PriceHandler,), {"calls": [], "finished": [], "lock": threading.Lock(), **behavior})
+    with serve(handler) as base_url:
+        yield HttpSource(base_url), handler
+
+
+class CountingBucket(TokenBucket):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.acquired = 0
+
+    def acquire(self):
+        super().acquire()
+        with self.lock:
+            self.acquired += 1
+
+
+def run(source, limiter=None, retry_count=3):
+    return fetch_closes(
+        CODES, START, END, source, chunk_size=4, retry_count=retry_count, sleep_time=0,
+        max_workers=4, limiter=limiter or CountingBucket(10000),
+    )
+
+
+def test_failures_stay_per_ticker():
+    with price_server(fail_always={"1005"}) as (source, server):
+        result = run(source)
+
+    assert set(result) == set(CODES) - {"1005"}
+    # 1005 を含むチャンクは一括で諦めたあと1銘柄ずつ取り直している
+    assert ("1004",) in server.calls and ("1006",) in server.calls
+    assert all(series.iloc[0] == float(code) for code, series in result.items())
+
+
+def test_retry_count_is_respected():
+    limiter = CountingBucket(10000)
+    with price_server(fail_always={"1005"}, fail_times={"1010": 2, "1017": 3}) as (source, server):
+        result = run(source, limiter, retry_count=3)
+    calls = Counter(server.calls)
+
+    # 2回失敗する銘柄は3回目の試行でチャンクごと取れる
+    assert calls[("1008", "1009", "1010", "1011")] == 3
+    assert "1010" in result
+    # 3回失敗する銘柄はチャンクの試行を使い切り、1銘柄ずつの取り直しで取れる
+    assert calls[("1016", "1017", "1018", "1019")] == 3
+    assert calls[("1017",)] == 1
+    assert "1017" in result
+    # 常に失敗する銘柄はチャンクで3回、単独で3回だけ試す
+    assert sum(count for chunk, count in calls.items() if "1005" in chunk) == 6
+    assert "1005" not in result
+    # すべての呼び出しがレート制限を通っている
+    assert limiter.acquired == len(server.calls)
+
+
+def test_results_keep_input_order():
+    # 先頭のチャンクを最も遅くしても、結果は入力の順に並ぶ
+    with price_server(fail_always={"1013"}, slow={"1000", "1001"}) as (source, server):
+        result = run(source)
+
+    assert server.finished[-1] == ("1000", "1001", "1002", "1003")
+    assert list(result) == [code for code in CODES if code != "1013"]
+
+
+def test_codes_left_out_of_a_batch_are_fetched_one_by_one():
+    # 一括取得は成功しても返されなかった銘柄は、失敗した銘柄と同じく1銘柄ずつ取り直す
+    with price_server(drop={"1002", "1009"}) as (source, server):
+        result = run(source)
+
+    assert list(result) == CODES
+    assert ("1002",) in server.calls and ("1009",) in server.calls
+    assert ("1001",) not in server.calls
+
+
+def test_fixture_source_splits_batches_per_code(tmp_path):
+    # {code}.csv の代替データから、チャンク単位の一括取得を銘柄ごとの系列に分ける
+    index = pd.bdate_range("2023-12-01", "2024-03-01")
+    for i, code in enumerate(CODES[:5]):
+        pd.DataFrame({"Date": index, "Close": 100.0 + i}).to_csv(tmp_path / f"{code}.csv", index=False)
+
+    class CountingFixtureSource(FixtureSource):
+        calls = 0
+
+        def download_closes(self, codes, start_date, end_date):
+            CountingFixtureSource.calls += 1
+            return super().download_closes(codes, start_date, end_date)
+
+    source = CountingFixtureSource(tmp_path)
+    empty = set()
+    result = fetch_closes(CODES[:6], START, END, source, chunk_size=3, sleep_time=0, empty=empty)
+
+    # 2チャンクを一括で取り、CSV のない銘柄だけを1銘柄ずつ（再試行を含めて3回）取り直す
+    assert source.calls == 2 + 3
+    assert list(result) == CODES[:5]  # CSV のない銘柄は含まれない
+    assert not empty  # CSV がないのは取得失敗で、足がないとは答えていない
+    for i, code in enumerate(CODES[:5]):
+        series = result[code]
+        assert series.index.min() >= pd.Timestamp(START) and series.index.max() < pd.Timestamp(END)
+        assert (series == 100.0 + i).all()
+
+
+def test_fixture_source_reports_range_without_rows(tmp_path):
+    pd.DataFrame({"Date": pd.bdate_range("2023-01-01", "2023-03-01"), "Close": 100.0}).to_csv(tmp_path / "1000.csv", index=False)
+    empty = set()
+    result = fetch_closes(["1000"], START, END, FixtureSource(tmp_path), sleep_time=0, empty=empty)
+
+    assert result == {}
+    assert empty == {"1000"}
+
+
+class FakeTicker:
+    # 銘柄ごとの history() の振る舞い: 足を返す / Yahoo が足なしと答える / 通信に失敗する
+    behaviors = {}
+
+    def __init__(self, symbol):
+        self.code = symbol.split(".")[0]
+
+    def history(self, start, end):
+        behavior = self.behaviors[self.code]
+        if behavior == "missing":
+            raise YFPricesMissingError(f"{self.code}.T", "")
+        if behavior == "error":
+            raise ConnectionError("通信に失敗")
+        index = pd.bdate_range(start, end, inclusive="left", tz="Asia/Tokyo")
+        return pd.DataFrame({"Close": 100.0}, index=index)
+
+
+@pytest.fixture
+def fake_ticker(monkeypatch):
+    monkeypatch.setattr(yfinance, "Ticker", FakeTicker)
+    monkeypatch.setattr(yfinance.config.debug, "hide_exceptions", True)
+    return FakeTicker
+
+
+def test_yfinance_batch_leaves_failed_tickers_out(fake_ticker, monkeypatch):
+    # yf.download() は失敗した銘柄を例外にせず、列を NaN のまま（または列なしで）返す
+    def download(tickers, start, end, **kwargs):
+        index = pd.bdate_range(start, end, inclusive="left")
+        return pd.DataFrame({("Close", "1000.T"): 100.0, ("Close", "1001.T"): float("nan")}, index=index)
+
+    monkeypatch.setattr(yfinance, "download", download)
+    fake_ticker.behaviors = {"1001": "bars", "1002": "error"}
+    source = YFinanceSource()
+    assert list(source.download_closes(["1000", "1001", "1002"], START, END)) == ["1000"]
+
+    # 返されなかった銘柄は1銘柄ずつ取り直し、それでも取れない銘柄だけが落ちる
+    result = fetch_closes(["1000", "1001", "1002"], START, END, source, sleep_time=0)
+    assert list(result) == ["1000", "1001"]
+
+
+def test_yfinance_source_separates_missing_bars_from_errors(fake_ticker):
+    fake_ticker.behaviors = {"1000": "bars", "1001": "missing", "1002": "error"}
+    empty = set()
+    result = fetch_closes(["1000", "1001", "1002"], START, END, YFinanceSource(), chunk_size=1, sleep_time=0, empty=empty)
+
+    assert list(result) == ["1000"]
+    assert result["1000"].index.tz is None
+    assert empty == {"1001"}  # 通信に失敗した 1002 は足なしとして扱わない
@@ -0,0 +1,113 @@
+import sqlite3
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+import getyfinance
+import price_store
+from fetch_pool import TokenBucket
+from price_store import PriceStore
+
+START, END = "2023-01-01", "2023-03-01"
+
+
+class StandInSource:
+    """1000 は足を返し、1001 は足なし（上場前など）と答え、1002 は取得に失敗する。
+    1003 は例外にならずに結果から落ちる（yf.download() の取得失敗と同じ）
+    """
+
+    def __init__(self):
+        self.requested = []
+
+    def download_closes(self, codes, start_date, end_date):
+        self.requested.extend(codes)
+        if "1002" in codes:
+            raise ConnectionError("取得失敗")
+        index = pd.bdate_range(start_date, end_date, inclusive="left")
+        result = {code: pd.Series(100.0, index=index) for code in codes if code == "1000"}
+        if "1001" in codes:
+            result["1001"] = pd.Series(dtype=float)
+        return result
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setitem(getyfinance.CONFIG, "SLEEP_TIME", 0)
+    monkeypatch.setattr(getyfinance, "_rate_limiter", TokenBucket(10000))
+    store = PriceStore(tmp_path / "prices.db")
+    yield store
+    store.close()
+
+
+def test_empty_range_is_not_fetched_again(store):
+    source = StandInSource()
+    codes = ["1000", "1001", "1002", "1003"]
+    histories = getyfinance.load_price_histories(store, codes, START, END, source)
+    assert list(histories) == ["1000"]
+    assert store.missing_ranges("1001", START, END) == []
+    assert store.missing_ranges("1003", START, END) == [(START, END)]
+
+    # 足がないと答えた銘柄は取り直さず、取得に失敗した銘柄だけをもう一度取りに行く
+    source.requested.clear()
+    getyfinance.load_price_histories(store, codes, START, END, source)
+    assert set(source.requested) == {"1002", "1003"}
+
+
+def test_empty_range_expires(store, monkeypatch):
+    store.mark_empty("1001", START, END)
+    assert store.missing_ranges("1001", START, END) == []
+
+    later = date.today() + timedelta(days=price_store.EMPTY_RANGE_DAYS)
+
+    class Later(date):
+        @classmethod
+        def today(cls):
+            return later
+
+    monkeypatch.setattr(price_store, "date", Later)
+    assert store.missing_ranges("1001", START, END) == [(START, END)]
+
+
+class AdjustingSource:
+    """調整後の終値を返す代替の取得元。factor を変えると過去の値もすべて変わる（分割・配当の後と同じ）"""
+
+    def __init__(self):
+        self.factor = 1.0
+        self.requested = []
+
+    def download_closes(self, codes, start_date, end_date):
+        self.requested.append((start_date, end_date))
+        index = pd.bdate_range(start_date, end_date, inclusive="left")
+        return {code: pd.Series(100.0 * self.factor, index=index) for code in codes}
+
+
+def test_changed_adjustment_refetches_the_code(store):
+    source = AdjustingSource()
+    getyfinance.load_price_histories(store, ["1000"], START, "2023-02-01", source)
+
+    # 調整が変わっていなければ、保存済みの足を1本含めて続きだけを取る
+    getyfinance.load_price_histories(store, ["1000"], START, "2023-02-15", source)
+    assert source.requested[-1] == ("2023-01-31", "2023-02-15")
+
+    # 配当落ちなどで過去の終値が変わると、続きと混ぜずに全期間を取り直す
+    source.factor = 0.98
+    source.requested.clear()
+    histories = getyfinance.load_price_histories(store, ["1000"], START, END, source)
+    assert source.requested == [("2023-02-14", END), (START, END)]
+    assert (histories["1000"] == 98.0).all()
+    assert histories["1000"].index[0] == pd.Timestamp("2023-01-02")
+    assert store.missing_ranges("1000", START, END) == []
+
+
+def test_read_only_store_does_not_fetch(store, tmp_path):
+    getyfinance.load_price_histories(store, ["1000"], START, "2023-02-01", AdjustingSource())
+
+    # pipeline の月ごとの処理は読むだけ: 足りない期間があっても取得せず、書き込みもできない
+    reader = PriceStore(tmp_path / "prices.db", read_only=True)
+    histories = getyfinance.read_price_histories(reader, ["1000", "1001"], START, END)
+    assert list(histories) == ["1000"]
+    assert histories["1000"].index.max() < pd.Timestamp("2023-02-01")
+    with pytest.raises(sqlite3.OperationalError):
+        reader.mark_empty("1001", START, END)
+    reader.close()